@@ -1,14 +1,71 @@
+import time
+STARTUP_TIME = time.perf_counter()  # Startup times are measured from here, so they include the imports below
+
+import os
+import sys
 import string
 import configparser
-import time
+import tempfile
+import shutil
+import pickle
+import hashlib
+import math
 import threading
+import bisect
+import re
+import queue
+import json
+import tracemalloc
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from xml.parsers import expat
+from xml.sax.saxutils import escape
 import tkinter as tk
-from tkinter import ttk, simpledialog
+from tkinter import ttk, simpledialog, filedialog
 import keyboard
-import mouse
-import pyautogui
+import pyperclip
+
+# The screen automation stack is only needed to click through the website, so it is imported by load_automation()
+# on first use, or by a background thread once the window is up, instead of delaying the keyboard hook
+mouse = None
+pyscreeze = None
+pyautogui = None
+Image = None
+cv2 = None
+numpy = None
+automation_lock = threading.Lock()
+
+SNIPPETS_SAVE_DELAY_MS = 500  # Edits made within this delay of the first one are written to the XML file together
+SNIPPETS_REPLACE_ATTEMPTS = 10  # Attempts at replacing the XML file while another thread has it open, which Windows refuses
+SNIPPETS_REPLACE_RETRY_DELAY = 0.05  # Seconds between attempts at replacing the XML file
+TREE_ROWS = 10  # Number of snippet rows visible in the Treeview
+BACKSPACE_DELAY = 0.01  # Seconds between the backspaces that erase a typed keyword
+CLIPBOARD_RESTORE_DELAY = 0.2  # Seconds between pasting a snippet and restoring the previous clipboard contents
+UI_EVENT_POLL_MS = 5  # Interval at which events posted from other threads are handled on the Tk thread while they keep coming
+UI_EVENT_IDLE_POLL_MS = 50  # Longest interval the polling backs off to while no events are posted
+EXPANSION_SETTLE_DELAY = 0.05  # Seconds keystrokes are still held after an expansion, so its own late keystrokes are told apart from the user's
+TYPED_KEY_NAMES = {' ': 'space', '\n': 'enter', '\t': 'tab'}  # Names the keyboard hook reports for typed whitespace
+MODIFIER_KEY_NAMES = frozenset(('shift', 'left shift', 'right shift', 'ctrl', 'left ctrl', 'right ctrl', 'alt', 'left alt', 'right alt', 'alt gr', 'windows', 'left windows', 'right windows'))  # Keys that never type anything themselves
+SEARCH_DELAY_MS = 150  # The search box filters the Treeview once typing has paused for this long
+SEARCH_MIN_TERM_LENGTH = 2  # Shorter search terms only match keyword prefixes
+SEARCH_WORD_PATTERN = re.compile(r"\w+")  # Words indexed for search
+LAZY_TEXT_FILE_SIZE = 4 * 1024 * 1024  # Snippet files at least this many bytes are loaded with lazy texts
+LAZY_TEXT_MIN_LENGTH = 256  # Texts at least this many characters long are left in the file when loading lazily
+SEARCH_INDEX_READ_BATCH = 256  # Snippets indexed per opening of the XML file, which is closed in between so it can be replaced
+SNIPPETS_CACHE_VERSION = 3  # Bump when the cached snippet or keyword index format changes
+SNIPPETS_CACHE_DIRECTORY = os.path.join(os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'NotatorAssistant')  # Per-user directory of the snapshot caches
+PLACEHOLDER_PATTERN = re.compile(r"\{(date|time|clipboard)(?::([^{}]*))?\}")  # {name} or {name:format} in snippet texts
+PLACEHOLDER_DATE_FORMAT = '%m/%d/%Y'  # strftime format of {date} placeholders without a format
+PLACEHOLDER_TIME_FORMAT = '%I:%M %p'  # strftime format of {time} placeholders without a format
+TEMPLATE_REGION_MARGIN = 64  # Pixels around an image's last location searched before falling back to the full screen
+AUTOMATION_INPUT_PAUSE = 0.05  # Seconds PyAutoGUI pauses after each click or keystroke of the screen automation
+AUTOMATION_SETTLE_DELAY = 0.1  # Seconds after a click before looking for what it brings up, so the page can react to it
+WAIT_POLL_INTERVAL = 0.02  # Seconds between searches for an image that is being waited for
+WAIT_FULL_SCREEN_INTERVAL = 0.25  # Seconds between full screen searches for an image that is not around its last location
+DIAGNOSTICS_REFRESH_MS = 1000  # Interval at which the diagnostics window refreshes its report
+CLICK_EVENT = '<click>'  # Line of an event trace that stands for a left mouse click
+AUTO_CLOSE_RETRIES = 1  # Times an auto close step waits again for an image that did not appear before stopping
 
 class SnippetDialog(simpledialog.Dialog):
     def __init__(self, master, title, initial_values=None):
@@ -138,7 +195,9 @@ class SettingsDialog(simpledialog.Dialog):
         tk.Label(master, text="Reset on click:", anchor="w").grid(row=2, column=0, sticky="w")
         tk.Label(master, text="Reset on tab:", anchor="w").grid(row=3, column=0, sticky="w")
         tk.Label(master, text="Timeout value (seconds):", anchor="w").grid(row=4, column=0, sticky="w")
-        tk.Label(master, text="Click Interval (seconds):", anchor="w").grid(row=5, column=0, sticky="w")
+        tk.Label(master, text="Click wait limit (seconds):", anchor="w").grid(row=5, column=0, sticky="w")
+        tk.Label(master, text="Expansion method:", anchor="w").grid(row=6, column=0, sticky="w")
+        tk.Label(master, text="Grayscale image matching:", anchor="w").grid(row=7, column=0, sticky="w")
 
         # Create BooleanVar and StringVar variables to hold settings values
         self.keyword_case_sensitive_var = tk.BooleanVar()
@@ -147,6 +206,8 @@ class SettingsDialog(simpledialog.Dialog):
         self.reset_on_tab_var = tk.BooleanVar()
         self.timeout_value_var = tk.StringVar()
         self.click_interval_var = tk.StringVar()
+        self.injection_backend_var = tk.StringVar()
+        self.grayscale_matching_var = tk.BooleanVar()
 
         # Create Checkbuttons and Entry widget to configure settings
         self.keyword_case_sensitive_checkbox = tk.Checkbutton(master, variable=self.keyword_case_sensitive_var)
@@ -167,6 +228,19 @@ class SettingsDialog(simpledialog.Dialog):
         self.click_interval_entry = tk.Entry(master, textvariable=self.click_interval_var, width=3)
         self.click_interval_entry.grid(row=5, column=1)
 
+        # Option menu of the expansion methods, labelled with their measured throughput
+        self.injection_backend_labels = {}
+        for name, injector in TEXT_INJECTORS.items():
+            throughput = self.initial_values.get('injection_throughput', {}).get(name) if self.initial_values else None
+            label = injector.label if throughput is None else f"{injector.label} ({throughput:,.0f} chars/s)"
+            self.injection_backend_labels[label] = name
+        self.injection_backend_menu = tk.OptionMenu(master, self.injection_backend_var, *self.injection_backend_labels)
+        self.injection_backend_menu.grid(row=6, column=1, sticky="e")
+        self.injection_backend_var.set(next(iter(self.injection_backend_labels)))
+
+        self.grayscale_matching_checkbox = tk.Checkbutton(master, variable=self.grayscale_matching_var)
+        self.grayscale_matching_checkbox.grid(row=7, column=1, sticky="e")
+
         if self.initial_values:
             # If initial values are provided, set them in the entry widgets
             self.keyword_case_sensitive_var.set(self.initial_values.get('keyword_case_sensitive', False))
@@ -175,6 +249,10 @@ class SettingsDialog(simpledialog.Dialog):
             self.reset_on_tab_var.set(self.initial_values.get('reset_on_tab', False))
             self.timeout_value_var.set(self.initial_values.get('timeout_value', ''))
             self.click_interval_var.set(self.initial_values.get('click_interval', ''))
+            for label, name in self.injection_backend_labels.items():
+                if name == self.initial_values.get('injection_backend'):
+                    self.injection_backend_var.set(label)
+            self.grayscale_matching_var.set(self.initial_values.get('grayscale_matching', False))
 
         return self.timeout_value_entry # Return the timeout value entry widget for initial focus
 
@@ -195,188 +273,346 @@ class SettingsDialog(simpledialog.Dialog):
         reset_on_tab = self.reset_on_tab_var.get()
         timeout_value = self.timeout_value_var.get()
         click_interval = self.click_interval_var.get()
+        injection_backend = self.injection_backend_labels[self.injection_backend_var.get()]
+        grayscale_matching = self.grayscale_matching_var.get()
 
-        self.result = {'case_sensitive': keyword_case_sensitive, 'backspace': reset_on_backspace, 'click': reset_on_click,  'tab': reset_on_tab, 'timeout': timeout_value, 'interval': click_interval}
+        self.result = {'case_sensitive': keyword_case_sensitive, 'backspace': reset_on_backspace, 'click': reset_on_click,  'tab': reset_on_tab, 'timeout': timeout_value, 'interval': click_interval, 'injection': injection_backend, 'grayscale': grayscale_matching}
 
-class NotatorAssistant:
-    def __init__(self, root, snippets_data, settings_data):
+class DiagnosticsWindow(tk.Toplevel):
+    def __init__(self, master, diagnostics):
         """
-        Initialize the NotatorAssistant class.
+        Initialize the DiagnosticsWindow class.
+
+        The window shows the diagnostics report and refreshes it every DIAGNOSTICS_REFRESH_MS while it is open.
+        Unlike the dialogs, it does not block the main window.
 
         Parameters:
-        - root: The root Tkinter window.
-        - snippets_data: Dictionary containing snippet data.
-        - settings_data: Dictionary containing application settings.
+        - master: The parent window.
+        - diagnostics: The Diagnostics to show.
 
         Returns:
         None
         """
-        # Initialize the NotatorAssistant class with the given root window
-        # Set the root window title
-        self.root = root
-        self.root.title("Notator Assistant")
-
-        # Set the icon for the root window
-        icon_path = "feather_quill_pen_write_sign_icon_124655.ico"
-        root.iconbitmap(icon_path)
-
-        self.current_word = ""  # Track the currently typed word
-        self.current_category = ""
-        self.current_subcategory = ""
-        self.current_reason = ""
-        self.snippets_data = snippets_data
-        self.settings_data = settings_data
-       
+        super().__init__(master)
+        self.title("Diagnostics")
+        self.diagnostics = diagnostics
+        self.refresh_after_id = None
+
+        # Text widget for the report with scrollbar
+        text_frame = tk.Frame(self, padx=10, pady=5)
+        text_frame.pack(side="top", fill="both", expand=True)
+        self.report_text = tk.Text(text_frame, height=30, width=100, wrap='none', state='disabled', font='TkFixedFont')
+        self.report_scrollbar = ttk.Scrollbar(text_frame, orient="vertical", command=self.report_text.yview)
+        self.report_text.configure(yscrollcommand=self.report_scrollbar.set)
+        self.report_text.pack(side="left", fill="both", expand=True)
+        self.report_scrollbar.pack(side="left", fill="y")
+
+        # Buttons for memory snapshots and export
+        button_frame = tk.Frame(self, padx=10, pady=5)
+        button_frame.pack(side="top", fill="x")
+        tk.Button(button_frame, text="Memory Snapshot", command=self.take_memory_snapshot).pack(side='left', padx=2)
+        self.tracing_button = tk.Button(button_frame, text="Stop Memory Tracing", command=self.stop_memory_tracing)
+        self.tracing_button.pack(side='left', padx=2)
+        tk.Button(button_frame, text="Export JSON...", command=self.export).pack(side='left', padx=2)
+        tk.Button(button_frame, text="Close", command=self.close).pack(side='right', padx=2)
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh()
+
+    def format_report(self, report):
+        """
+        Format the diagnostics report as text.
 
-        # Create and pack three frames for organizing widgets
-        self.frame1 = tk.Frame(root, padx=10, pady=5)
-        self.frame2 = tk.Frame(root, padx=10, pady=5)
-        self.frame3 = tk.Frame(root, padx=10, pady=5)
+        Parameters:
+        - report: The report from Diagnostics.report.
 
-        self.frame1.pack(side="top", fill="both", expand=True)
-        self.frame2.pack(side="top", fill="both", expand=True)
-        self.frame3.pack(side="top", fill="both", expand=True)
+        Returns:
+        - text: The formatted report.
+        """
+        lines = [f"{'Timer (ms)':<24}{'count':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+        for name, summary in report['timers_ms'].items():
+            lines.append(f"{name:<24}{summary['count']:>8}" + "".join(f"{summary[key]:>10.2f}" for key in ('mean', 'p50', 'p90', 'p99', 'max')))
+
+        lines.append("")
+        for name, stats in report['components'].items():
+            lines.append(f"{name}:")
+            for key, value in stats.items():
+                lines.append(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+
+        lines.append("")
+        lines.append(f"Memory tracing: {'on' if report['memory_tracing'] else 'off'}")
+        for snapshot in report['memory_snapshots'][-1:]:
+            lines.append(f"Last snapshot at {snapshot['time']}: {snapshot['current_kb']:,.0f} KB traced, {snapshot['peak_kb']:,.0f} KB peak")
+            for stat in snapshot['top']:
+                lines.append(f"  {stat['size_kb']:>10,.1f} KB {stat['count']:>8} blocks  {stat['location']}")
+        return "\n".join(lines)
+
+    def refresh(self):
+        """
+        Show the current report, then schedule the next refresh.
 
-        # Buttons for snippet management
-        self.add_button = tk.Button(self.frame1, text="Add Snippet", command=self.add_snippet)
-        self.add_button.pack(side='left', padx=2)
+        Parameters:
+        None
 
-        self.edit_button = tk.Button(self.frame1, text="Edit Snippet", command=self.edit_snippet)
-        self.edit_button.pack(side='left', padx=2)
+        Returns:
+        None
+        """
+        top = self.report_text.yview()[0]  # Keep the scroll position across refreshes
+        self.report_text.config(state='normal')
+        self.report_text.delete('1.0', 'end')
+        self.report_text.insert('1.0', self.format_report(self.diagnostics.report()))
+        self.report_text.config(state='disabled')
+        self.report_text.yview_moveto(top)
+        self.refresh_after_id = self.after(DIAGNOSTICS_REFRESH_MS, self.refresh)
+
+    def take_memory_snapshot(self):
+        """
+        Take a memory snapshot and show it.
 
-        self.remove_button = tk.Button(self.frame1, text="Remove Snippet", command=self.remove_snippet)
-        self.remove_button.pack(side='left', padx=2)
+        Parameters:
+        None
 
-        self.clear_button = tk.Button(self.frame1, text="Clear Jam", command=self.clear_modifiers)
-        self.clear_button.pack(side='right', padx=2)
+        Returns:
+        None
+        """
+        self.diagnostics.take_memory_snapshot()
+        self.after_cancel(self.refresh_after_id)
+        self.refresh()
 
-        self.fill_button = tk.Button(self.frame1, text="Auto Fill (Ctrl+`)", command=self.auto_fill_categories)
-        self.fill_button.pack(side='right', padx=2)
+    def stop_memory_tracing(self):
+        """
+        Stop memory tracing.
 
-        self.close_button = tk.Button(self.frame1, text="Auto Close (Alt+`)", command=self.auto_close_issues)
-        self.close_button.pack(side='right', padx=2)
+        Parameters:
+        None
 
-        # Treeview for displaying snippets with scrollbar
-        self.tree = ttk.Treeview(self.frame2, columns=('Keyword', 'Text'), show='headings', yscrollcommand=self.tree_yview)
-        self.tree.heading('Keyword', text='Keyword', command=lambda: self.sort_treeview('Keyword', False))
-        self.tree.heading('Text', text='Text', command=lambda: self.sort_treeview('Text', False))
-        self.tree.column('Keyword', width=100)
-        self.tree.column('Text', width=800)
+        Returns:
+        None
+        """
+        self.diagnostics.stop_memory_tracing()
 
-        # Populate the Treeview with snippet data
-        for keyword, snippet_entry in snippets_data.items():
-            category, subcategory, reason, text = snippet_entry
-            
-            # Display only the first line of multiline text
-            display_text = self.extract_first_line(text)
-            self.tree.insert('', 'end', values=(keyword, display_text))
+    def export(self):
+        """
+        Ask for a file name and export the report to it as JSON.
 
-        # Scrollbar for the Treeview
-        self.tree_scrollbar = ttk.Scrollbar(self.frame2, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=self.tree_scrollbar.set)
+        Parameters:
+        None
 
-        # Pack the Treeview and scrollbar
-        self.tree.pack(side="left", pady=5)
-        self.tree_scrollbar.pack(side="left", fill="y", pady=5)
+        Returns:
+        None
+        """
+        path = filedialog.asksaveasfilename(parent=self, title="Export Diagnostics", defaultextension=".json",
+                                            initialfile=f"diagnostics-{time.strftime('%Y%m%d-%H%M%S')}.json",
+                                            filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+        if path:
+            try:
+                self.diagnostics.export(path)
+            except OSError as e:
+                tk.messagebox.showinfo("Export Failed", f"The diagnostics could not be exported: {e}", parent=self)
+
+    def close(self):
+        """
+        Stop refreshing and close the window.
 
-        # Text widget for displaying snippet details with scrollbar
-        self.text_display = tk.Text(self.frame3, height=10, width=112, wrap='word', state='disabled')
+        Parameters:
+        None
 
-        # Scrollbar for the Text widget
-        self.text_scrollbar = ttk.Scrollbar(self.frame3, orient="vertical", command=self.text_display_yview)
-        self.text_display.configure(yscrollcommand=self.text_scrollbar.set)
+        Returns:
+        None
+        """
+        if self.refresh_after_id is not None:
+            self.after_cancel(self.refresh_after_id)
+        self.destroy()
 
-        # Pack the Text widget and scrollbar
-        self.text_display.pack(side="left", pady=5)
-        self.text_scrollbar.pack(side="left", fill="y", pady=5)
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    Application settings, validated once when created and read by attribute on every event.
 
-        # Register the keyboard events
-        keyboard.on_press(self.on_key_press)
+    Settings are immutable; a change is published by replacing the whole object.
+    """
+    keyword_case_sensitive: bool = False
+    reset_on_backspace: bool = False
+    reset_on_click: bool = True
+    reset_on_tab: bool = True
+    timeout_value: float = 5.0
+    click_interval: float = 1.0
+    injection_backend: str = 'type'
+    grayscale_matching: bool = False
+
+    def __post_init__(self):
+        """
+        Validate the settings values.
 
-        # Set Pyautogui default values
-        pyautogui.PAUSE = float(self.settings_data.get('Settings', 'click_interval'))
-        pyautogui.FAILSAFE = True
+        Parameters:
+        None
 
-        # Bind the TreeView selection event to update the Text widget
-        self.tree.bind("<ButtonRelease-1>", self.on_tree_click)
+        Returns:
+        None
+        """
+        if not self.timeout_value > 0:
+            raise ValueError("The timeout value must be greater than zero.")
+        if not self.click_interval >= 0:
+            raise ValueError("The click interval cannot be negative.")
+        if self.injection_backend not in TEXT_INJECTORS:
+            raise ValueError(f"Unknown expansion method '{self.injection_backend}'.")
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a Settings object from a configparser object, using the defaults for missing values.
 
-        # Bind the window close event to the method that unhooks the keyboard
-        root.protocol("WM_DELETE_WINDOW", self.on_window_close)
+        Parameters:
+        - config: A configparser.ConfigParser object with a 'Settings' section.
 
-        # Initialize the timeout timer
-        self.timeout_timer = None
-        self.timeout_duration = self.settings_data.get('Settings', 'timeout_value')  # Timeout duration in seconds
+        Returns:
+        - settings: The Settings object.
+        """
+        defaults = cls()
+        return cls(
+            keyword_case_sensitive=config.getboolean('Settings', 'keyword_case_sensitive', fallback=defaults.keyword_case_sensitive),
+            reset_on_backspace=config.getboolean('Settings', 'reset_on_backspace', fallback=defaults.reset_on_backspace),
+            reset_on_click=config.getboolean('Settings', 'reset_on_click', fallback=defaults.reset_on_click),
+            reset_on_tab=config.getboolean('Settings', 'reset_on_tab', fallback=defaults.reset_on_tab),
+            timeout_value=config.getfloat('Settings', 'timeout_value', fallback=defaults.timeout_value),
+            click_interval=config.getfloat('Settings', 'click_interval', fallback=defaults.click_interval),
+            injection_backend=config.get('Settings', 'injection_backend', fallback=defaults.injection_backend),
+            grayscale_matching=config.getboolean('Settings', 'grayscale_matching', fallback=defaults.grayscale_matching)
+        )
+
+    def to_config(self):
+        """
+        Convert the settings to a configparser object for saving.
 
-        # Start the timeout timer thread
-        self.start_timeout_timer()
+        Parameters:
+        None
 
-        # Bind left mouse button click event to reset_current_word
-        mouse.on_click(self.on_mouse_click)
-        
-        self.create_menu()
+        Returns:
+        - config: A configparser.ConfigParser object with a 'Settings' section.
+        """
+        config = configparser.ConfigParser()
+        config['Settings'] = {
+            'keyword_case_sensitive': str(self.keyword_case_sensitive),
+            'reset_on_backspace': str(self.reset_on_backspace),
+            'reset_on_click': str(self.reset_on_click),
+            'reset_on_tab': str(self.reset_on_tab),
+            'timeout_value': f"{self.timeout_value:g}",
+            'click_interval': f"{self.click_interval:g}",
+            'injection_backend': self.injection_backend,
+            'grayscale_matching': str(self.grayscale_matching)
+        }
+        return config
 
-    def create_menu(self):
+class LatencyHistogram:
+    def __init__(self, lowest=0.0001, sub_buckets=4):
         """
-        Create the menu bar for the application.
+        Initialize the LatencyHistogram class.
+
+        Latencies are counted in logarithmic buckets, each a fixed fraction wider than the one before, so the
+        histogram stays small while keeping the same relative precision from sub-millisecond to minute latencies.
 
         Parameters:
-        None
+        - lowest: (optional) The upper bound of the first bucket, in seconds.
+        - sub_buckets: (optional) The number of buckets per doubling of the latency.
 
         Returns:
         None
         """
-        # Create a menu bar
-        menu_bar = tk.Menu(self.root)
-        self.root.config(menu=menu_bar)
+        self.lowest = lowest
+        self.sub_buckets = sub_buckets
+        self.counts = []  # Number of latencies recorded in each bucket
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def bucket(self, seconds):
+        """
+        Get the bucket a latency is counted in.
 
-        # Create a File menu
-        file_menu = tk.Menu(menu_bar, tearoff=0)
-        menu_bar.add_cascade(label="File", menu=file_menu)
+        Parameters:
+        - seconds: The latency.
 
-        # Add File menu options
-        file_menu.add_command(label="Add Snippet", command=self.add_snippet)
-        file_menu.add_command(label="Edit Snippet", command=self.edit_snippet)
-        file_menu.add_command(label="Remove Snippet", command=self.remove_snippet)
-        file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.on_window_close)
+        Returns:
+        - index: The index of the bucket.
+        """
+        if seconds <= self.lowest:
+            return 0
+        return math.ceil(math.log2(seconds / self.lowest) * self.sub_buckets)
 
-        # Create an Options menu
-        options_menu = tk.Menu(menu_bar, tearoff=0)
-        menu_bar.add_cascade(label="Options", menu=options_menu)
+    def bucket_limit(self, index):
+        """
+        Get the upper bound of a bucket.
 
-        # Add Options menu options
-        options_menu.add_command(label="Settings", command=self.edit_settings)
+        Parameters:
+        - index: The index of the bucket.
 
-    def start_timeout_timer(self):
+        Returns:
+        - seconds: The largest latency counted in the bucket.
+        """
+        return self.lowest * 2 ** (index / self.sub_buckets)
+
+    def record(self, seconds):
         """
-        Start the timeout timer thread.
+        Record a latency.
 
         Parameters:
-        None
+        - seconds: The latency.
 
         Returns:
         None
         """
-        self.timeout_timer = threading.Timer(int(self.settings_data.get('Settings', 'timeout_value')), self.reset_current_word)
-        self.timeout_timer.start()
+        index = self.bucket(seconds)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        """
+        Get a percentile of the recorded latencies, to the precision of the buckets.
 
-    def reset_timeout_timer(self):
+        Parameters:
+        - percent: The percentile, from 0 to 100.
+
+        Returns:
+        - seconds: The latency below which the given percentage of latencies fall, or 0.0 if none were recorded.
         """
-        Reset the timeout timer.
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bucket_limit(index), self.max)
+        return 0.0
+
+    def summary(self):
+        """
+        Get the main statistics of the recorded latencies.
 
         Parameters:
         None
 
         Returns:
-        None
+        - stats: A dictionary with the count, mean, p50, p90, p99 and max latencies, in seconds.
         """
-        if self.timeout_timer:
-            self.timeout_timer.cancel()
-        self.start_timeout_timer()
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
 
-    def reset_current_word(self):
+class Diagnostics:
+    def __init__(self):
         """
-        Reset the current word when the timeout occurs.
+        Initialize the Diagnostics class.
+
+        Diagnostics collects the latency histograms of the timed operations, the statistics other components
+        keep of themselves, and tracemalloc memory snapshots, for the diagnostics window and JSON export.
 
         Parameters:
         None
@@ -384,61 +620,70 @@ class NotatorAssistant:
         Returns:
         None
         """
-        self.current_word = ""
+        self.lock = threading.Lock()  # Timers are recorded from several threads
+        self.histograms = {}  # LatencyHistogram of each timed operation, by name
+        self.sources = {}  # Functions returning the statistics of other components, by name
+        self.memory_snapshots = []  # Summaries of the memory snapshots taken
 
-    def extract_first_line(self, text):
+    def record(self, name, seconds):
         """
-        Extract the first line of the text.
+        Record the duration of a timed operation. Safe to call from any thread.
 
         Parameters:
-        - text: The text content to extract the first line from
+        - name: The name of the operation.
+        - seconds: The duration.
 
         Returns:
-        - first_line: The first line of the provided text
+        None
         """
-        first_line = text.split('\n')[0]
-        return first_line
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
 
-    def edit_settings(self):
+    def add_source(self, name, stats):
         """
-        Open the SettingsDialog to edit application settings.
+        Include the statistics of a component in the report.
 
         Parameters:
-        None
+        - name: The name of the component.
+        - stats: A function returning the statistics as a dictionary.
 
         Returns:
         None
         """
-        initial_values = {
-            'keyword_case_sensitive': self.settings_data.get('Settings', 'keyword_case_sensitive'),
-            'reset_on_backspace': self.settings_data.get('Settings', 'reset_on_backspace'),
-            'reset_on_click': self.settings_data.get('Settings', 'reset_on_click'),
-            'reset_on_tab': self.settings_data.get('Settings', 'reset_on_tab'),
-            'timeout_value': self.settings_data.get('Settings', 'timeout_value'),
-            'click_interval': self.settings_data.get('Settings', 'click_interval')
-        }
+        self.sources[name] = stats
 
-        dialog = SettingsDialog(self.root, "Settings", initial_values=initial_values)
-        result = dialog.result
+    def take_memory_snapshot(self, limit=10):
+        """
+        Take a memory snapshot of the largest allocations, starting memory tracing first if it is off.
 
-        if result:
-            # Update the settings_data dictionary
-            self.settings_data['Settings']['keyword_case_sensitive'] = str(result['case_sensitive'])
-            self.settings_data['Settings']['reset_on_backspace'] = str(result['backspace'])
-            self.settings_data['Settings']['reset_on_click'] = str(result['click'])
-            self.settings_data['Settings']['reset_on_tab'] = str(result['tab'])
-            self.settings_data['Settings']['timeout_value'] = result['timeout']
-            self.settings_data['Settings']['click_interval'] = result['interval']
+        Allocations made before tracing started are not included, so the first snapshot after starting is the
+        least complete.
 
-            # Update the click interval
-            pyautogui.PAUSE = float(self.settings_data.get('Settings', 'click_interval'))
+        Parameters:
+        - limit: (optional) The number of allocation sites to include.
 
-            # Save the updated settings to the INI file (if needed)
-            self.save_settings_to_ini()
+        Returns:
+        - snapshot: A dictionary with the current and peak traced memory and the largest allocation sites.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+        snapshot = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'current_kb': current / 1024,
+            'peak_kb': peak / 1024,
+            'top': [{'location': str(stat.traceback[0]), 'size_kb': stat.size / 1024, 'count': stat.count} for stat in statistics]
+        }
+        self.memory_snapshots.append(snapshot)
+        return snapshot
 
-    def save_settings_to_ini(self):
+    def stop_memory_tracing(self):
         """
-        Save the settings to the INI file.
+        Stop memory tracing, which slows down every allocation while it is on.
 
         Parameters:
         None
@@ -446,129 +691,3363 @@ class NotatorAssistant:
         Returns:
         None
         """
-        try:
-            with open(ini_file, 'w') as configfile:  # Open the INI file for writing
-                self.settings_data.write(configfile)  # Write the settings to the INI file
-        except FileNotFoundError as e:
-            # Handle file not found error
-            print(f"Error saving settings to INI file: {e}")
+        tracemalloc.stop()
 
-    def add_snippet(self):
+    def report(self):
         """
-        Open the SnippetDialog to add a new snippet.
+        Get everything collected so far.
 
         Parameters:
         None
 
         Returns:
-        None
+        - report: A dictionary with the timer statistics in milliseconds, the component statistics and the memory snapshots.
         """
-        dialog = SnippetDialog(self.root, "Add Snippet")
-        result = dialog.result
-
-        if result:
-            keyword, category, subcategory, reason, text = result
+        with self.lock:
+            timers = {name: {key: value if key == 'count' else value * 1000 for key, value in histogram.summary().items()}
+                      for name, histogram in sorted(self.histograms.items())}
+
+        components = {}
+        for name, stats in self.sources.items():
+            try:
+                components[name] = stats()
+            except Exception as e:
+                components[name] = {'error': str(e)}
+
+        return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': sys.platform,
+            'timers_ms': timers,
+            'components': components,
+            'memory_tracing': tracemalloc.is_tracing(),
+            'memory_snapshots': list(self.memory_snapshots)
+        }
 
-            # Check if the keyword contains spaces
-            if ' ' in keyword:
-                tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot contain spaces. Please choose a different keyword.")
-                return
+    def export(self, path):
+        """
+        Write the report to a JSON file.
 
-            # Check if the keyword is empty
-            elif keyword == "":
-                tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot be empty. Please enter a keyword.")
-                return
+        Parameters:
+        - path: The path to the JSON file.
 
-            # Check if the text is empty
-            elif text == "":
-                tk.messagebox.showinfo("Invalid Text", "The text cannot be empty. Please enter some text.")
-                return
+        Returns:
+        None
+        """
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2, default=str)
 
-            # Check if the keyword already exists in the snippets_data dictionary
-            elif keyword in self.snippets_data:
-                tk.messagebox.showinfo("Duplicate Keyword", f"The keyword '{keyword}' already exists. Please choose a different keyword.")
-                return
+DIAGNOSTICS = Diagnostics()  # Shared by every component that times its operations
 
-            else:
-                # Create a tuple containing category, subcategory, reason, and text
-                snippet_entry = (category, subcategory, reason, text)
-                    
-                # Add the new snippet to the snippets_data dictionary
-                self.snippets_data[keyword] = snippet_entry
-                    
-                # Display only the first line of multiline text
-                display_text = self.extract_first_line(text)
+class SnippetFileChangedError(Exception):
+    """
+    Raised when a text left in the XML file is read after another program has rewritten the file.
+    """
 
-                # Insert the new snippet into the TreeView
-                self.tree.insert('', 'end', values=(keyword, display_text))
+class LazyText:
+    __slots__ = ('xml_file', 'start', 'end', 'first_line', 'file_size', 'file_mtime', 'value')
 
-                # Add the new snippet to the XML file
-                self.save_snippet_to_xml(keyword, snippet_entry)
-    
-    def edit_snippet(self):
+    def __init__(self, xml_file, start, end, first_line, file_size, file_mtime):
         """
-        Open the SnippetDialog to edit an existing snippet.
+        Initialize the LazyText class.
+
+        A LazyText stands in for a large snippet text that is left in the XML file until it is needed.
 
         Parameters:
-        None
+        - xml_file: The path to the XML file containing the text.
+        - start: The byte offset of the opening <text> tag.
+        - end: The byte offset of the closing </text> tag.
+        - first_line: The first line of the text, kept in memory for display.
+        - file_size: The size of the XML file the offsets are in.
+        - file_mtime: The modification time of the XML file the offsets are in, in nanoseconds.
 
         Returns:
         None
         """
-        selected_item = self.tree.selection()
+        self.xml_file = xml_file
+        self.start = start
+        self.end = end
+        self.first_line = first_line
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.value = None  # The text once it has been loaded
+
+    def __reduce__(self):
+        """
+        Pickle the LazyText compactly for the snapshot cache, as the loaded text once it has been loaded.
 
-        if selected_item:
-            keyword, display_text = self.tree.item(selected_item, 'values')
-            snippet_entry = self.snippets_data.get(keyword, "")
-            
-            category = snippet_entry[0]
-            subcategory = snippet_entry[1]
-            reason = snippet_entry[2]
-            fulltext = snippet_entry[3]
-
-            # Convert empty tags from nonetype to empty string
-            if category is None:
-                category = ""
-            if subcategory is None:
-                subcategory = ""
-            if reason is None:
-                reason = ""
-            if fulltext is None:
-                fulltext = ""
+        Parameters:
+        None
 
-            # Pre-populate the dialog with the selected snippet values
-            initial_values = {'keyword': keyword, 'category': category, 'subcategory': subcategory, 'reason': reason, 'text': fulltext}
-            dialog = SnippetDialog(self.root, "Edit Snippet", initial_values=initial_values)
-            result = dialog.result
+        Returns:
+        - A tuple of the callable and arguments that recreate the object.
+        """
+        if self.value is not None:
+            return (str, (self.value,))
+        return (LazyText, (self.xml_file, self.start, self.end, self.first_line, self.file_size, self.file_mtime))
 
-            if result:
-                new_keyword, new_category, new_subcategory, new_reason, new_text = result
+    def read(self, file=None):
+        """
+        Read the text from the XML file without keeping it loaded, or return it if it has already been loaded.
 
-                # Create a tuple containing new_category, new_subcategory, new_reason, and new_text
-                new_snippet_entry = (new_category, new_subcategory, new_reason, new_text) 
+        Parameters:
+        - file: (optional) The XML file, already opened in binary mode, to read many texts without reopening it.
 
-                # Update the snippets_data dictionary
-                self.snippets_data.pop(keyword, None)
-                self.snippets_data[new_keyword] = new_snippet_entry
+        Returns:
+        - text: The snippet text.
 
-                # Display only the first line of multiline text
-                display_text = self.extract_first_line(new_text)
+        Raises:
+        - SnippetFileChangedError: If the XML file is no longer the one the text was found in.
+        """
+        if self.value is not None:
+            return self.value
+        if file is None:
+            with open(self.xml_file, 'rb') as file:
+                return self.read(file)
+        self.check_file(file)
+        file.seek(self.start)
+        data = file.read(self.end - self.start)
+        return ET.fromstring(data + b'</text>').text  # Parse the element so entities are resolved
+
+    def check_file(self, file):
+        """
+        Make sure an open XML file is still the one the text was found in, going by its size and modification time.
 
-                # Update the TreeView with the new keyword and text
-                self.tree.item(selected_item, values=(new_keyword, display_text))
+        Parameters:
+        - file: The XML file, opened in binary mode.
 
-                # Update the text_display with the new keyword and text
-                self.text_display.config(state='normal')  # Enable editing temporarily
-                self.text_display.delete(1.0, tk.END)
-                self.text_display.insert(tk.END, f"{new_text}")
-                self.text_display.config(state='disabled')  # Disable editing again
+        Returns:
+        None
+
+        Raises:
+        - SnippetFileChangedError: If the file has been rewritten since, and the offsets would read the wrong bytes.
+        """
+        stat = os.fstat(file.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != (self.file_size, self.file_mtime):
+            raise SnippetFileChangedError(f"{self.xml_file} was changed by another program after it was loaded. "
+                                          "Restart Notator Assistant to load the snippets again.")
+
+    def load(self):
+        """
+        Load the text from the XML file, or return it if it has already been loaded.
+
+        Parameters:
+        None
+
+        Returns:
+        - text: The snippet text.
+        """
+        if self.value is None:
+            self.value = self.read()
+        return self.value
+
+class SnippetTemplate:
+    __slots__ = ('parts',)
+
+    def __init__(self, parts):
+        """
+        Initialize the SnippetTemplate class.
+
+        A SnippetTemplate is the render plan of a snippet text containing placeholders, compiled once so that
+        expanding the snippet only fills in the placeholder values.
+
+        Parameters:
+        - parts: A tuple of literal strings and (placeholder name, format) tuples, in text order.
+
+        Returns:
+        None
+        """
+        self.parts = parts
+
+    @staticmethod
+    def compile(text):
+        """
+        Compile a snippet text into its render plan.
+
+        {date} and {time} take an optional strftime format, as in {date:%Y-%m-%d}. Anything else in braces,
+        including placeholders with an invalid format, is left as it is.
+
+        Parameters:
+        - text: The snippet text.
+
+        Returns:
+        - plan: The text itself if it has no placeholders, otherwise a SnippetTemplate.
+        """
+        if '{' not in text:
+            return text
+
+        parts = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            name, fmt = match.groups()
+            if name == 'clipboard' and fmt is not None:
+                continue  # The clipboard has no formats
+            if fmt is not None:
+                try:
+                    time.strftime(fmt)
+                except ValueError:
+                    continue
+            if match.start() > position:
+                parts.append(text[position:match.start()])
+            parts.append((name, fmt))
+            position = match.end()
+
+        if not parts:
+            return text
+        if position < len(text):
+            parts.append(text[position:])
+        return SnippetTemplate(tuple(parts))
+
+    def render(self, get_clipboard):
+        """
+        Fill in the placeholders with their current values.
+
+        Parameters:
+        - get_clipboard: The function returning the clipboard text.
+
+        Returns:
+        - text: The text to expand.
+        """
+        now = time.localtime()
+        pieces = []
+        for part in self.parts:
+            if isinstance(part, str):
+                pieces.append(part)
+            elif part[0] == 'date':
+                pieces.append(time.strftime(part[1] or PLACEHOLDER_DATE_FORMAT, now))
+            elif part[0] == 'time':
+                pieces.append(time.strftime(part[1] or PLACEHOLDER_TIME_FORMAT, now))
+            else:
+                pieces.append(get_clipboard() or "")
+        return "".join(pieces)
+
+class Snippet:
+    __slots__ = ('category', 'subcategory', 'reason', 'stored_text', 'plan')
+
+    def __init__(self, category, subcategory, reason, text):
+        """
+        Initialize the Snippet class.
+
+        Empty values are normalized to empty strings once here, and the category, subcategory and reason
+        are interned since the same few values repeat across many snippets.
+
+        Parameters:
+        - category: The category of the snippet, or None.
+        - subcategory: The subcategory of the snippet, or None.
+        - reason: The reason of the snippet, or None.
+        - text: The text of the snippet, a string, a LazyText or None.
+
+        Returns:
+        None
+        """
+        self.category = sys.intern(category or "")
+        self.subcategory = sys.intern(subcategory or "")
+        self.reason = sys.intern(reason or "")
+        self.stored_text = text or ""  # The text, or a LazyText if it was left in the XML file
+
+        # Compile the render plan now, or on the first expansion if the text was left in the XML file
+        self.plan = None if isinstance(self.stored_text, LazyText) else SnippetTemplate.compile(self.stored_text)
+
+    def __reduce__(self):
+        """
+        Pickle the Snippet for the snapshot cache, re-interning its strings when it is loaded.
+
+        Parameters:
+        None
+
+        Returns:
+        - A tuple of the callable and arguments that recreate the object.
+        """
+        return (Snippet, (self.category, self.subcategory, self.reason, self.stored_text))
+
+    @property
+    def text(self):
+        """
+        The text of the snippet, loaded from the XML file if it was left there.
+        """
+        if isinstance(self.stored_text, LazyText):
+            return self.stored_text.load()
+        return self.stored_text
+
+    def render(self, get_clipboard):
+        """
+        Get the text to expand, with its placeholders filled in.
+
+        Parameters:
+        - get_clipboard: The function returning the clipboard text.
+
+        Returns:
+        - text: The text to expand.
+        """
+        plan = self.plan
+        if plan is None:
+            plan = self.plan = SnippetTemplate.compile(self.text)
+        if isinstance(plan, str):
+            return plan
+        return plan.render(get_clipboard)
+
+    @property
+    def first_line(self):
+        """
+        The first line of the text of the snippet, without loading the text if it was left in the XML file.
+        """
+        if isinstance(self.stored_text, LazyText):
+            return self.stored_text.first_line
+        return self.stored_text.partition('\n')[0]
+
+class InputBackend(ABC):
+    """
+    Interface to the keyboard, mouse, clipboard and screen of the desktop the assistant works on.
+
+    The expansion engine and the screen automation only go through a backend, so they can run against the real
+    desktop or replay a recorded session headless.
+    """
+    failsafe_exception = ()  # Exception raised when the user takes back control of the mouse, if the backend has one
+
+    @abstractmethod
+    def hook_keys(self, callback):
+        """
+        Call a function with every key press event, from the backend's own thread.
+
+        Parameters:
+        - callback: The function to call with the event, which has the key name as its name attribute.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def hook_clicks(self, callback):
+        """
+        Call a function on every left mouse click, from the backend's own thread.
+
+        Parameters:
+        - callback: The function to call.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def unhook_all(self):
+        """
+        Remove the key and click hooks.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def is_pressed(self, key):
+        """
+        Check if a key is held down.
+
+        Parameters:
+        - key: The name of the key.
+
+        Returns:
+        - True: If the key is held down
+        - False: If the key is not held down
+        """
+
+    @abstractmethod
+    def press(self, key):
+        """
+        Press a key down.
+
+        Parameters:
+        - key: The name of the key.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def release(self, key):
+        """
+        Release a key.
+
+        Parameters:
+        - key: The name of the key.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def send(self, hotkey):
+        """
+        Press and release a key or key combination, such as 'tab' or 'ctrl+v'.
+
+        Parameters:
+        - hotkey: The key combination.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def write(self, text, delay=0):
+        """
+        Type text at the cursor.
+
+        Parameters:
+        - text: The text to type.
+        - delay: (optional) Seconds between keystrokes.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def click(self, x, y):
+        """
+        Click the left mouse button at a screen position.
+
+        Parameters:
+        - x: The horizontal screen position.
+        - y: The vertical screen position.
+
+        Returns:
+        None
+        """
+
+    @abstractmethod
+    def screenshot(self, region=None):
+        """
+        Capture the screen.
+
+        Parameters:
+        - region: (optional) The (left, top, width, height) box to capture instead of the full screen.
+
+        Returns:
+        The screenshot as a PIL image.
+        """
+
+    @abstractmethod
+    def screen_size(self):
+        """
+        Get the size of the screen.
+
+        Parameters:
+        None
+
+        Returns:
+        The (width, height) of the screen in pixels.
+        """
+
+    @abstractmethod
+    def get_clipboard(self):
+        """
+        Get the clipboard text.
+
+        Parameters:
+        None
+
+        Returns:
+        - text: The clipboard text.
+        """
+
+    @abstractmethod
+    def set_clipboard(self, text):
+        """
+        Replace the clipboard text.
+
+        Parameters:
+        - text: The new clipboard text.
+
+        Returns:
+        None
+        """
+
+    def clock(self):
+        """
+        Get the time that waits are measured in.
+
+        Parameters:
+        None
+
+        Returns:
+        - seconds: A monotonic time in seconds.
+        """
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        """
+        Wait between keystrokes, or for the screen to change.
+
+        Parameters:
+        - seconds: The number of seconds to wait.
+
+        Returns:
+        None
+        """
+        time.sleep(seconds)
+
+class DesktopBackend(InputBackend):
+    def __init__(self):
+        """
+        Initialize the DesktopBackend class, which works on the real desktop through keyboard, mouse, PyAutoGUI,
+        PyScreeze and pyperclip.
+
+        Only the keyboard is set up here; the mouse and screen automation modules are loaded on first use.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+
+    @property
+    def failsafe_exception(self):
+        """PyAutoGUI's FailSafeException, raised when the mouse is moved to a corner of the screen."""
+        load_automation()
+        return pyautogui.FailSafeException
+
+    def hook_keys(self, callback):
+        """Call a function with every key press, through keyboard.on_press."""
+        keyboard.on_press(callback)
+
+    def hook_clicks(self, callback):
+        """Call a function on every left click, through mouse.on_click. Loads the automation stack."""
+        load_automation()
+        mouse.on_click(callback)
+
+    def unhook_all(self):
+        """Remove all keyboard and mouse hooks."""
+        keyboard.unhook_all()
+        if mouse is not None:
+            mouse.unhook_all()
+
+    def is_pressed(self, key):
+        """Check if a key is held down, with keyboard.is_pressed."""
+        return keyboard.is_pressed(key)
+
+    def press(self, key):
+        """Press a key down with keyboard.press."""
+        keyboard.press(key)
+
+    def release(self, key):
+        """Release a key with keyboard.release."""
+        keyboard.release(key)
+
+    def send(self, hotkey):
+        """Press and release a key combination with keyboard.send."""
+        keyboard.send(hotkey)
+
+    def write(self, text, delay=0):
+        """Type text with keyboard.write."""
+        keyboard.write(text, delay=delay)
+
+    def click(self, x, y):
+        """Click with PyAutoGUI, which pauses AUTOMATION_INPUT_PAUSE afterwards and honors its failsafe."""
+        load_automation()
+        pyautogui.click(x, y)
+
+    def screenshot(self, region=None):
+        """Capture the screen, or a region of it, with PyScreeze."""
+        load_automation()
+        return pyscreeze.screenshot(region=region)
+
+    def screen_size(self):
+        """Get the size of the screen with PyAutoGUI."""
+        load_automation()
+        return tuple(pyautogui.size())
+
+    def get_clipboard(self):
+        """Get the clipboard text with pyperclip."""
+        return pyperclip.paste()
+
+    def set_clipboard(self, text):
+        """Replace the clipboard text with pyperclip."""
+        pyperclip.copy(text)
+
+class ReplayKeyEvent:
+    __slots__ = ('name', 'event_type')
+
+    def __init__(self, name):
+        """
+        Initialize the ReplayKeyEvent class, a replayed key press with the attributes the handlers use.
+
+        Parameters:
+        - name: The name of the key.
+
+        Returns:
+        None
+        """
+        self.name = name
+        self.event_type = 'down'
+
+class TraceReplayBackend(InputBackend):
+    def __init__(self, trace=(), screens=()):
+        """
+        Initialize the TraceReplayBackend class.
+
+        The backend replays a recorded session headless and at full speed. Key presses and clicks from the trace
+        are fed to the hooks by replay(). Screenshots are served from image files, moving on to the next file on
+        every click, and waits take no real time. Everything written, sent and clicked is recorded.
+
+        Parameters:
+        - trace: (optional) A list of key names, with CLICK_EVENT for a mouse click, as read by read_event_trace.
+        - screens: (optional) Paths to the screenshots of the session, in the order they are seen.
+
+        Returns:
+        None
+        """
+        self.trace = list(trace)
+        self.screens = []
+        if screens:
+            load_automation()  # Pillow reads the screenshots
+        for path in screens:
+            with Image.open(path) as image:
+                self.screens.append(image.convert('RGB'))
+        self.screen_index = 0
+        self.key_callbacks = []
+        self.click_callbacks = []
+        self.held = set()  # Keys pressed down and not yet released
+        self.clipboard = ""
+        self.output = []  # Replayed ('key', name) and recorded ('write', text), ('paste', text), ('send', hotkey), ('press', key), ('release', key) and ('click', x, y)
+        self.time = 0.0  # Seconds of waiting, which replays skip
+
+    def replay(self, after_event=None):
+        """
+        Feed the trace to the hooks, one event at a time on the calling thread.
+
+        Parameters:
+        - after_event: (optional) A function to call after each event, such as handling the posted UI events.
+
+        Returns:
+        - count: The number of events replayed.
+        """
+        for name in self.trace:
+            if name == CLICK_EVENT:
+                for callback in self.click_callbacks:
+                    callback()
+            else:
+                self.output.append(('key', name))  # The key reaches the focused application as well as the hooks
+                event = ReplayKeyEvent(name)
+                for callback in self.key_callbacks:
+                    callback(event)
+            if after_event is not None:
+                after_event()
+        return len(self.trace)
+
+    def written_text(self):
+        """
+        Get the text the replayed keys and the backend typed or pasted so far, with backspaces applied.
+
+        Parameters:
+        None
+
+        Returns:
+        - text: The text the focused application would contain.
+        """
+        text = []
+        for entry in self.output:
+            if entry[0] == 'key':
+                if entry[1] == 'backspace':
+                    if text:
+                        text.pop()
+                elif entry[1] in ('space', 'enter', 'tab'):
+                    text.append({'space': ' ', 'enter': '\n', 'tab': '\t'}[entry[1]])
+                elif len(entry[1]) == 1:
+                    text.append(entry[1])
+            elif entry[0] == 'write':
+                text.extend(entry[1])
+            elif entry[0] == 'press' and entry[1] == 'backspace' and text:
+                text.pop()
+            elif entry[0] == 'paste':
+                text.extend(entry[1])
+        return "".join(text)
+
+    def hook_keys(self, callback):
+        """Add a function to call with every replayed key press."""
+        self.key_callbacks.append(callback)
+
+    def hook_clicks(self, callback):
+        """Add a function to call on every replayed click."""
+        self.click_callbacks.append(callback)
+
+    def unhook_all(self):
+        """Remove the replay hooks."""
+        self.key_callbacks.clear()
+        self.click_callbacks.clear()
+
+    def is_pressed(self, key):
+        """Check if a key was pressed and not released through the backend."""
+        return key in self.held
+
+    def press(self, key):
+        """Record a key press."""
+        self.held.add(key)
+        self.output.append(('press', key))
+
+    def release(self, key):
+        """Record a key release."""
+        self.held.discard(key)
+        self.output.append(('release', key))
+
+    def send(self, hotkey):
+        """Record a key combination, or the text pasted by ctrl+v."""
+        if hotkey == 'ctrl+v':
+            self.output.append(('paste', self.clipboard))  # Keep what was pasted, the clipboard may be restored afterwards
+        else:
+            self.output.append(('send', hotkey))
+
+    def write(self, text, delay=0):
+        """Record typed text."""
+        self.output.append(('write', text))
+
+    def click(self, x, y):
+        """Record a click and move on to the next recorded screen."""
+        self.output.append(('click', x, y))
+        if self.screen_index < len(self.screens) - 1:
+            self.screen_index += 1  # The next recorded screen shows what the click brought up
+
+    def screenshot(self, region=None):
+        """Serve the current recorded screen, or a region of it."""
+        if not self.screens:
+            raise OSError("No screenshots to replay")
+        screen = self.screens[self.screen_index]
+        if region is not None:
+            left, top, width, height = region
+            screen = screen.crop((left, top, left + width, top + height))
+        return screen
+
+    def screen_size(self):
+        """Get the size of the current recorded screen."""
+        if not self.screens:
+            raise OSError("No screenshots to replay")
+        return self.screens[self.screen_index].size
+
+    def get_clipboard(self):
+        """Get the replay clipboard text."""
+        return self.clipboard
+
+    def set_clipboard(self, text):
+        """Replace the replay clipboard text."""
+        self.clipboard = text
+
+    def clock(self):
+        """Get the replay time, which only advances when waiting for the screen."""
+        return self.time
+
+    def sleep(self, seconds):
+        """Advance the replay time without waiting."""
+        self.time += seconds
+
+class TextInjector:
+    label = "Type"
+
+    def __init__(self, backend):
+        """
+        Initialize the TextInjector class.
+
+        A text injector replaces the typed keyword with the snippet text in the focused application. This
+        base class types the text through the input backend, and records the throughput it achieves.
+
+        Parameters:
+        - backend: The InputBackend to type with.
+
+        Returns:
+        None
+        """
+        self.backend = backend
+        self.injected_chars = 0
+        self.injection_seconds = 0.0
+
+    def erase(self, count):
+        """
+        Erase characters before the cursor by pressing backspace.
+
+        Parameters:
+        - count: The number of characters to erase.
+
+        Returns:
+        None
+        """
+        for _ in range(count):
+            self.backend.press('backspace')
+            self.backend.release('backspace')
+            self.backend.sleep(BACKSPACE_DELAY)
+
+    def write(self, text):
+        """
+        Write text at the cursor.
+
+        Parameters:
+        - text: The text to write.
+
+        Returns:
+        None
+        """
+        self.backend.write(text)
+
+    def key_names(self, erase_count, text):
+        """
+        Get the names the keyboard hook reports for the keys inject presses, modifiers left out.
+
+        Parameters:
+        - erase_count: The number of typed characters to erase.
+        - text: The snippet text to write.
+
+        Returns:
+        - names: A list of casefolded key names, in the order the keys are pressed.
+        """
+        return ['backspace'] * erase_count + [TYPED_KEY_NAMES.get(char, char).casefold() for char in text]
+
+    def inject(self, erase_count, text):
+        """
+        Erase the typed keyword and write the snippet text, measuring how fast the text is written.
+
+        Parameters:
+        - erase_count: The number of typed characters to erase.
+        - text: The snippet text to write.
+
+        Returns:
+        None
+        """
+        erase_start_time = time.perf_counter()
+        self.erase(erase_count)
+        start_time = time.perf_counter()
+        self.write(text)
+        end_time = time.perf_counter()
+        self.injection_seconds += end_time - start_time
+        self.injected_chars += len(text)
+        DIAGNOSTICS.record('injection', end_time - erase_start_time)
+
+    def throughput(self):
+        """
+        Get the measured throughput of the injector.
+
+        Parameters:
+        None
+
+        Returns:
+        - The number of characters written per second, or None if nothing has been written yet.
+        """
+        if not self.injection_seconds:
+            return None
+        return self.injected_chars / self.injection_seconds
+
+class ClipboardTextInjector(TextInjector):
+    label = "Paste from clipboard"
+
+    def write(self, text):
+        """
+        Write text at the cursor by pasting it. The clipboard contents are replaced; inject restores them.
+
+        Parameters:
+        - text: The text to write.
+
+        Returns:
+        None
+        """
+        self.backend.set_clipboard(text)
+        self.backend.send('ctrl+v')
+
+    def key_names(self, erase_count, text):
+        """
+        Get the names the keyboard hook reports for the keys inject presses, modifiers left out.
+
+        Parameters:
+        - erase_count: The number of typed characters to erase.
+        - text: The snippet text to paste.
+
+        Returns:
+        - names: A list of casefolded key names, in the order the keys are pressed.
+        """
+        return ['backspace'] * erase_count + ['v']
+
+    def inject(self, erase_count, text):
+        """
+        Erase the typed keyword and paste the snippet text, measuring how fast the text is written, then restore
+        the previous clipboard contents.
+
+        Only text clipboard contents can be restored. The wait before restoring them is not timed.
+
+        Parameters:
+        - erase_count: The number of typed characters to erase.
+        - text: The snippet text to write.
+
+        Returns:
+        None
+        """
+        previous_clipboard = self.backend.get_clipboard()
+        super().inject(erase_count, text)
+        self.backend.sleep(CLIPBOARD_RESTORE_DELAY)  # Give the application time to read the clipboard before restoring it
+        self.backend.set_clipboard(previous_clipboard)
+
+# Text injectors selectable in the settings, by the name stored in the INI file
+TEXT_INJECTORS = {
+    'type': TextInjector,
+    'paste': ClipboardTextInjector
+}
+
+class KeywordIndex:
+    def __init__(self, keywords, case_sensitive):
+        """
+        Initialize the KeywordIndex class.
+
+        The index maps each normalized keyword (casefolded unless keywords are case sensitive) to the
+        snippet keywords that share it, and keeps the normalized keywords in a prefix tree so the typed
+        word can be followed one character at a time.
+
+        Parameters:
+        - keywords: Iterable of snippet keywords.
+        - case_sensitive: True if keywords should be matched with case sensitivity, False otherwise.
+
+        Returns:
+        None
+        """
+        self.case_sensitive = case_sensitive
+        self.keys = {}  # Normalized keyword -> list of snippet keywords, the first one being used for expansion
+        self.root_node = {}  # Each node is a dictionary of child nodes keyed by character
+        for keyword in keywords:
+            self.add(keyword)
+
+    def normalize(self, text):
+        """
+        Normalize text for comparison according to the case sensitivity setting.
+
+        Parameters:
+        - text: The text to normalize.
+
+        Returns:
+        - The normalized text.
+        """
+        return text if self.case_sensitive else text.casefold()
+
+    def add(self, keyword):
+        """
+        Add a keyword to the index.
+
+        Parameters:
+        - keyword: The keyword to add.
+
+        Returns:
+        - keywords: The list of keywords sharing the normalized keyword, more than one if they collide.
+        """
+        key = self.normalize(keyword)
+        keywords = self.keys.get(key)
+        if keywords is not None:
+            if keyword not in keywords:
+                keywords.append(keyword)
+            return keywords
+
+        node = self.root_node
+        for char in key:
+            node = node.setdefault(char, {})
+        node[None] = key  # The None key marks the end of a keyword and holds the normalized keyword
+
+        keywords = self.keys[key] = [keyword]
+        return keywords
+
+    def remove(self, keyword):
+        """
+        Remove a keyword from the index, pruning prefix tree nodes that are no longer needed.
+
+        Parameters:
+        - keyword: The keyword to remove.
+
+        Returns:
+        None
+        """
+        key = self.normalize(keyword)
+        keywords = self.keys.get(key)
+        if keywords is None or keyword not in keywords:
+            return
+
+        keywords.remove(keyword)
+        if keywords:
+            return  # A colliding keyword takes over the normalized keyword
+        del self.keys[key]
+
+        path = [self.root_node]
+        for char in key:
+            path.append(path[-1][char])
+        del path[-1][None]
+
+        # Walk back up and drop the nodes that no longer lead to any keyword
+        for depth in range(len(key), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][key[depth - 1]]
+
+    def lookup(self, word):
+        """
+        Look up the snippet keyword matching a word.
+
+        Parameters:
+        - word: The typed word.
+
+        Returns:
+        - keyword: The matching keyword, or None if the word is not a keyword.
+        """
+        keywords = self.keys.get(self.normalize(word))
+        return keywords[0] if keywords else None
+
+    def collisions(self):
+        """
+        Get the keywords that can no longer be told apart once normalized.
+
+        Parameters:
+        None
+
+        Returns:
+        - collisions: A list of keyword lists, the first keyword of each being the one that is expanded.
+        """
+        return [keywords for keywords in self.keys.values() if len(keywords) > 1]
+
+class KeywordMatcher:
+    def __init__(self, keywords, case_sensitive, index=None):
+        """
+        Initialize the KeywordMatcher class.
+
+        The matcher follows the typed word through the prefix tree of a KeywordIndex one character at a
+        time, so resolving a match on space costs the same regardless of library size.
+
+        Parameters:
+        - keywords: Iterable of snippet keywords.
+        - case_sensitive: True if keywords should be matched with case sensitivity, False otherwise.
+        - index: (optional) A prebuilt KeywordIndex of the keywords, used if it has the same case sensitivity.
+
+        Returns:
+        None
+        """
+        if index is None or index.case_sensitive != case_sensitive:
+            index = KeywordIndex(keywords, case_sensitive)
+        self.index = index
+        self.reset()
+
+    @property
+    def case_sensitive(self):
+        """
+        True if keywords are matched with case sensitivity, False otherwise.
+        """
+        return self.index.case_sensitive
+
+    def set_case_sensitive(self, keywords, case_sensitive):
+        """
+        Rebuild the index for a new case sensitivity setting and swap it in.
+
+        Parameters:
+        - keywords: Iterable of snippet keywords.
+        - case_sensitive: True if keywords should be matched with case sensitivity, False otherwise.
+
+        Returns:
+        None
+        """
+        index = KeywordIndex(keywords, case_sensitive)  # Build the new index off to the side
+        self.path = [index.root_node]
+        self.index = index  # Swap it in with a single assignment
+
+    def add(self, keyword):
+        """
+        Add a keyword to the matcher.
+
+        Parameters:
+        - keyword: The keyword to add.
+
+        Returns:
+        - keywords: The list of keywords sharing the normalized keyword, more than one if they collide.
+        """
+        return self.index.add(keyword)
+
+    def remove(self, keyword):
+        """
+        Remove a keyword from the matcher.
+
+        Parameters:
+        - keyword: The keyword to remove.
+
+        Returns:
+        None
+        """
+        self.index.remove(keyword)
+
+    def reset(self):
+        """
+        Move the matcher back to the start of a new word.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.path = [self.index.root_node]  # Nodes visited for each typed character, None once no keyword can match
+
+    def feed(self, char):
+        """
+        Advance the matcher by one typed character.
+
+        Parameters:
+        - char: The typed character.
+
+        Returns:
+        None
+        """
+        node = self.path[-1]
+        if node is not None:
+            for normalized_char in self.index.normalize(char):  # Casefolding may expand a character
+                node = node.get(normalized_char)
+                if node is None:
+                    break
+        self.path.append(node)
+
+    def backspace(self):
+        """
+        Step the matcher back by one character.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if len(self.path) > 1:
+            self.path.pop()
+
+    def match(self):
+        """
+        Get the keyword matching the characters typed so far.
+
+        Parameters:
+        None
+
+        Returns:
+        - keyword: The matching keyword, or None if the typed word is not a keyword.
+        """
+        node = self.path[-1]
+        if node is None or None not in node:
+            return None
+        keywords = self.index.keys.get(node[None])
+        return keywords[0] if keywords else None
+
+class SearchIndex:
+    def __init__(self, snippets_data, on_ready=None):
+        """
+        Initialize the SearchIndex class.
+
+        The index keeps the casefolded keywords sorted for prefix search, and an inverted index from the
+        words of each snippet's category, subcategory, reason and text to the keywords of the snippets
+        containing them. It is built on a background thread so it does not hold up startup. Until it is
+        ready, snippet edits are queued and applied once it is, and searches scan the snippets instead.
+
+        Parameters:
+        - snippets_data: A dictionary containing keywords as keys and Snippet objects as values, kept up to date
+                         by the caller and scanned while the index is being built.
+        - on_ready: (optional) A function to call once the index is ready. Called on the background thread.
+
+        Returns:
+        None
+        """
+        self.snippets_data = snippets_data
+        self.on_ready = on_ready
+        self.sorted_keywords = []  # Sorted (casefolded keyword, keyword) pairs
+        self.postings = {}  # Word -> set of keywords of the snippets containing it
+        self.snippet_words = {}  # Keyword -> words indexed for the snippet, used to remove it
+        self.term_cache = {}  # Search term -> words containing it
+        self.ready = threading.Event()
+        self.lock = threading.Lock()  # Makes queueing an edit and finishing the build atomic
+        self.pending_edits = []  # Edits made while the index is being built
+
+        snippets = list(snippets_data.items())  # Snapshot taken on the calling thread
+        threading.Thread(target=self.build, args=(snippets,), name="SearchIndex", daemon=True).start()
+
+    def build(self, snippets):
+        """
+        Index the given snippets. Runs on the background thread.
+
+        Parameters:
+        - snippets: A list of (keyword, Snippet) pairs.
+
+        Returns:
+        None
+        """
+        try:
+            # The snippets are in file order, so their texts are read in one pass over the file. It is closed
+            # between batches, as Windows does not let the snippet writer replace a file that is open.
+            for start in range(0, len(snippets), SEARCH_INDEX_READ_BATCH):
+                files = {}  # XML files the texts left in them are read from, each opened once for the batch
+                try:
+                    for keyword, snippet in snippets[start:start + SEARCH_INDEX_READ_BATCH]:
+                        self.index_snippet(keyword, snippet, files)
+                finally:
+                    for file in files.values():
+                        file.close()
+            self.sorted_keywords.sort()
+        finally:
+            # Apply the edits made during the build, in order, before edits are applied directly
+            with self.lock:
+                for edit in self.pending_edits:
+                    self.apply(edit)
+                self.pending_edits = []
+                self.ready.set()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def snippet_text(self, snippet, files=None):
+        """
+        Get the text of a snippet for indexing, without keeping texts left in the XML file loaded.
+
+        Parameters:
+        - snippet: The Snippet object.
+        - files: (optional) A dictionary of open XML files by path, to read texts left in them from.
+                 Files that are not open yet are opened and added to it.
+
+        Returns:
+        - text: The snippet text, or only its first line if the XML file has been rewritten since it was loaded.
+        """
+        lazy_text = snippet.stored_text
+        if not isinstance(lazy_text, LazyText):
+            return lazy_text
+        try:
+            if files is None:
+                return lazy_text.read()
+            file = files.get(lazy_text.xml_file)
+            if file is None:
+                file = files[lazy_text.xml_file] = open(lazy_text.xml_file, 'rb')
+            return lazy_text.read(file)
+        except SnippetFileChangedError:
+            return lazy_text.first_line
+
+    def index_snippet(self, keyword, snippet, files=None):
+        """
+        Add a snippet to the inverted index and the keyword list, leaving the keyword list unsorted.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+        - snippet: The Snippet object.
+        - files: (optional) A dictionary of open XML files by path, passed on to snippet_text.
+
+        Returns:
+        None
+        """
+        searchable = " ".join((snippet.category, snippet.subcategory, snippet.reason, self.snippet_text(snippet, files))).casefold()
+        words = frozenset(SEARCH_WORD_PATTERN.findall(searchable))
+        for word in words:
+            keywords = self.postings.get(word)
+            if keywords is None:
+                keywords = self.postings[word] = set()
+                self.term_cache.clear()  # Cached terms may also be in the new word
+            keywords.add(keyword)
+        self.snippet_words[keyword] = words
+        self.sorted_keywords.append((keyword.casefold(), keyword))
+
+    def add(self, keyword, snippet):
+        """
+        Add a snippet to the index, or queue its addition while the index is being built.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+        - snippet: The Snippet object.
+
+        Returns:
+        None
+        """
+        self.edit(('add', keyword, snippet))
+
+    def remove(self, keyword):
+        """
+        Remove a snippet from the index, or queue its removal while the index is being built.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+
+        Returns:
+        None
+        """
+        self.edit(('remove', keyword))
+
+    def edit(self, edit):
+        """
+        Apply a snippet edit to the index, or queue it while the index is being built.
+
+        Parameters:
+        - edit: The edit, ('add', keyword, snippet) or ('remove', keyword).
+
+        Returns:
+        None
+        """
+        with self.lock:
+            if not self.ready.is_set():
+                self.pending_edits.append(edit)
+                return
+        self.apply(edit)
+
+    def apply(self, edit):
+        """
+        Apply a snippet edit to the index.
+
+        Parameters:
+        - edit: The edit, ('add', keyword, snippet) or ('remove', keyword).
+
+        Returns:
+        None
+        """
+        if edit[0] == 'add':
+            _, keyword, snippet = edit
+            self.index_snippet(keyword, snippet)
+            entry = self.sorted_keywords.pop()
+            bisect.insort(self.sorted_keywords, entry)
+            return
+
+        _, keyword = edit
+        for word in self.snippet_words.pop(keyword, ()):
+            keywords = self.postings[word]
+            keywords.discard(keyword)
+            if not keywords:
+                del self.postings[word]
+                self.term_cache.clear()  # Cached terms may refer to the removed word
+        entry = (keyword.casefold(), keyword)
+        position = bisect.bisect_left(self.sorted_keywords, entry)
+        if position < len(self.sorted_keywords) and self.sorted_keywords[position] == entry:
+            del self.sorted_keywords[position]
+
+    def words_containing(self, term):
+        """
+        Get the indexed words that contain a search term.
+
+        Parameters:
+        - term: The casefolded search term.
+
+        Returns:
+        - words: A list of the words containing the term.
+        """
+        words = self.term_cache.get(term)
+        if words is None:
+            # While typing, the words containing the term are among those containing the term minus its last character
+            candidates = self.term_cache.get(term[:-1], self.postings)
+            words = [word for word in candidates if term in word]
+            if len(self.term_cache) >= 256:
+                self.term_cache.clear()
+            self.term_cache[term] = words
+        return words
+
+    def search(self, query):
+        """
+        Find the snippets whose keyword starts with the query, or whose words contain every term of the query.
+
+        Terms shorter than SEARCH_MIN_TERM_LENGTH characters are only matched against keyword prefixes.
+
+        Parameters:
+        - query: The search query.
+
+        Returns:
+        - keywords: A set of the keywords of the matching snippets.
+        """
+        if not self.ready.is_set():
+            return self.scan(query)
+        query = query.casefold()
+
+        # Keywords starting with the query
+        start = bisect.bisect_left(self.sorted_keywords, (query,))
+        end = bisect.bisect_left(self.sorted_keywords, (query + "\U0010ffff",), start)
+        keywords = {keyword for _, keyword in self.sorted_keywords[start:end]}
+
+        # Snippets containing every term of the query
+        terms = SEARCH_WORD_PATTERN.findall(query)
+        if terms and all(len(term) >= SEARCH_MIN_TERM_LENGTH for term in terms):
+            matches = None
+            for term in sorted(terms, key=len, reverse=True):  # Longer terms usually narrow the matches the most
+                term_matches = set().union(*(self.postings[word] for word in self.words_containing(term)))
+                matches = term_matches if matches is None else matches & term_matches
+                if not matches:
+                    break
+            keywords |= matches
+
+        return keywords
+
+    def scan(self, query):
+        """
+        Find the snippets matching the query by going through all of them, while the index is being built.
+
+        Texts left in the XML file are not read, so only their first line is matched.
+
+        Parameters:
+        - query: The search query.
+
+        Returns:
+        - keywords: A set of the keywords of the matching snippets.
+        """
+        query = query.casefold()
+        terms = SEARCH_WORD_PATTERN.findall(query)
+        match_terms = bool(terms) and all(len(term) >= SEARCH_MIN_TERM_LENGTH for term in terms)
+        keywords = set()
+        for keyword, snippet in self.snippets_data.items():
+            if keyword.casefold().startswith(query):
+                keywords.add(keyword)
+            elif match_terms:
+                text = snippet.stored_text
+                if isinstance(text, LazyText):
+                    text = text.first_line
+                searchable = " ".join((snippet.category, snippet.subcategory, snippet.reason, text)).casefold()
+                if all(term in searchable for term in terms):
+                    keywords.add(keyword)
+        return keywords
+
+class DeadlineTimer:
+    def __init__(self, callback):
+        """
+        Initialize the DeadlineTimer class.
+
+        A single long-lived worker thread waits for the latest deadline and calls the callback once
+        it passes. Scheduling only moves the deadline, so no thread is created per keystroke.
+
+        Parameters:
+        - callback: The function to call when the deadline passes.
+
+        Returns:
+        None
+        """
+        self.callback = callback
+        self.deadline = None  # time.monotonic() value at which the callback is due, None when idle
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Jitter statistics, i.e. how late the callback ran compared to its deadline
+        self.fire_count = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+        self.thread = threading.Thread(target=self.run, name="DeadlineTimer", daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay):
+        """
+        Set the deadline to the given delay from now, replacing any pending deadline.
+
+        Parameters:
+        - delay: The delay in seconds.
+
+        Returns:
+        None
+        """
+        deadline = time.monotonic() + delay
+        with self.condition:
+            # Only wake the worker if it would otherwise sleep past the new deadline
+            wake = self.deadline is None or deadline < self.deadline
+            self.deadline = deadline
+            if wake:
+                self.condition.notify()
+
+    def cancel(self):
+        """
+        Cancel the pending deadline.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        with self.condition:
+            self.deadline = None
+
+    def stop(self):
+        """
+        Stop the worker thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        with self.condition:
+            self.running = False
+            self.deadline = None
+            self.condition.notify()
+
+    def jitter_stats(self):
+        """
+        Get the timer jitter statistics.
+
+        Parameters:
+        None
+
+        Returns:
+        - stats: A dictionary with the number of times the callback ran and the mean and max jitter in milliseconds.
+        """
+        with self.condition:
+            mean_jitter = self.total_jitter / self.fire_count if self.fire_count else 0.0
+            return {'fired': self.fire_count, 'mean_jitter_ms': mean_jitter * 1000, 'max_jitter_ms': self.max_jitter * 1000}
+
+    def run(self):
+        """
+        Wait for deadlines and call the callback when they pass. Runs on the worker thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.deadline is None:
+                        self.condition.wait()
+                        continue
+
+                    remaining = self.deadline - time.monotonic()
+                    if remaining > 0:
+                        self.condition.wait(remaining)
+                        continue
+
+                    # The deadline has passed, record how late we are and clear it
+                    jitter = -remaining
+                    self.fire_count += 1
+                    self.total_jitter += jitter
+                    self.max_jitter = max(self.max_jitter, jitter)
+                    self.deadline = None
+                    DIAGNOSTICS.record('timer_jitter', jitter)
+                    break
+                else:
+                    return
+
+            try:
+                self.callback()  # Call outside the lock so the callback can reschedule
+            except Exception as e:
+                print(f"Error in timer callback: {e}")
+
+class SnippetWriter:
+    def __init__(self, xml_file, snippets_data, on_error=None):
+        """
+        Initialize the SnippetWriter class.
+
+        The writer keeps its own copy of the snippets and a background thread that applies snippet
+        edits to it in the order they were made and writes the XML file off the UI thread. Edits made
+        close together are written in one batch. A batch that fails to be written stays in the copy,
+        and is written again with the next one, or when the writer is closed.
+
+        Parameters:
+        - xml_file: The path to the XML file to write.
+        - snippets_data: A dictionary containing keywords as keys and snippet entries as values.
+        - on_error: (optional) A function to call with the error message when a batch could not be written.
+                    Called on the writer thread.
+
+        Returns:
+        None
+        """
+        self.xml_file = xml_file
+        self.snippets_data = dict(snippets_data)  # Copy owned by the writer thread
+        self.events = queue.Queue()
+        self.on_error = on_error
+        self.dirty = False  # True while the copy has edits the last write failed to save
+
+        # Flush statistics
+        self.flush_count = 0
+        self.failed_flush_count = 0
+        self.last_error = None
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        self.thread = threading.Thread(target=self.run, name="SnippetWriter", daemon=True)
+        self.thread.start()
+
+    def add(self, keyword, snippet_entry):
+        """
+        Queue the addition of a snippet.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+        - snippet_entry: The snippet entry.
+
+        Returns:
+        None
+        """
+        self.events.put(('add', keyword, snippet_entry))
+
+    def update(self, old_keyword, new_keyword, snippet_entry):
+        """
+        Queue the update of a snippet.
+
+        Parameters:
+        - old_keyword: The old keyword of the snippet.
+        - new_keyword: The new keyword of the snippet.
+        - snippet_entry: The new snippet entry.
+
+        Returns:
+        None
+        """
+        self.events.put(('update', old_keyword, new_keyword, snippet_entry))
+
+    def remove(self, keyword):
+        """
+        Queue the removal of a snippet.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+
+        Returns:
+        None
+        """
+        self.events.put(('remove', keyword))
+
+    def close(self):
+        """
+        Write any queued edits, and the edits of a failed write, and stop the writer thread.
+
+        Parameters:
+        None
+
+        Returns:
+        - error: The error message if the edits could not be written, None otherwise.
+        """
+        self.events.put(None)
+        self.thread.join()
+        return self.last_error if self.dirty else None
+
+    def stats(self):
+        """
+        Get the writer statistics.
+
+        Parameters:
+        None
+
+        Returns:
+        - stats: A dictionary with the queue depth, the number of flushes, the number of failed flushes and the last
+                 error, and the last and max flush latency in milliseconds.
+        """
+        return {
+            'queue_depth': self.events.qsize(),
+            'flushes': self.flush_count,
+            'failed_flushes': self.failed_flush_count,
+            'last_error': self.last_error,
+            'last_flush_latency_ms': self.last_flush_latency * 1000,
+            'max_flush_latency_ms': self.max_flush_latency * 1000
+        }
+
+    def apply(self, event):
+        """
+        Apply a snippet edit to the writer's copy of the snippets.
+
+        Parameters:
+        - event: The queued edit.
+
+        Returns:
+        None
+        """
+        if event[0] == 'add':
+            _, keyword, snippet_entry = event
+            self.snippets_data[keyword] = snippet_entry
+        elif event[0] == 'update':
+            _, old_keyword, new_keyword, snippet_entry = event
+            if new_keyword != old_keyword:
+                self.snippets_data.pop(old_keyword, None)
+            self.snippets_data[new_keyword] = snippet_entry
+        elif event[0] == 'remove':
+            _, keyword = event
+            self.snippets_data.pop(keyword, None)
+
+    def run(self):
+        """
+        Apply queued edits in order and write them to the XML file in batches. Runs on the writer thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        running = True
+        while running:
+            event = self.events.get()  # Wait for the first edit of a batch
+            if event is None:
+                # Closing with no new edits, write the edits of a failed write once more
+                if self.dirty:
+                    self.flush()
+                return
+
+            # Collect the edits made within the batch delay of the first one
+            batch_deadline = time.monotonic() + SNIPPETS_SAVE_DELAY_MS / 1000
+            while event is not None:
+                self.apply(event)
+                try:
+                    event = self.events.get(timeout=max(batch_deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            else:
+                running = False  # Closing, write this last batch and stop
+            self.flush()
+
+    def flush(self):
+        """
+        Write the writer's copy of the snippets to the XML file. Runs on the writer thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        start_time = time.perf_counter()
+        try:
+            if write_snippets_to_xml(self.xml_file, self.snippets_data):
+                error = None
+            else:
+                error = f"{self.xml_file} could not be written"
+        except Exception as e:
+            # Keep the thread alive so later edits are still written
+            print(f"Error saving snippets: {e}")
+            error = str(e)
+        latency = time.perf_counter() - start_time
+        DIAGNOSTICS.record('xml_save', latency)
+
+        self.flush_count += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.dirty = error is not None
+        if error is not None:
+            self.failed_flush_count += 1
+            self.last_error = error
+            if self.on_error is not None:
+                self.on_error(error)
+
+class ExpansionWorker:
+    def __init__(self, on_done):
+        """
+        Initialize the ExpansionWorker class.
+
+        Snippet expansions are performed on a dedicated worker thread, one at a time and in the order they were
+        submitted, so the keyboard hook only has to match the keyword and hand the expansion over.
+
+        Keys received while an expansion is in flight are held, since the hook also reports the keys the expansion
+        presses. Once it has been written, the keys it generated are told apart from the ones the user typed,
+        which are passed on.
+
+        Parameters:
+        - on_done: The function to call once an expansion has been written, with the held keys the user typed.
+
+        Returns:
+        None
+        """
+        self.on_done = on_done
+        self.busy = threading.Event()  # Set while an expansion is in flight
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()  # Makes holding a key and finishing an expansion atomic
+        self.held_keys = []  # Keys received while the expansion is in flight
+        self.generated_keys = []  # Names of the keys the expansion in flight presses
+
+        self.thread = threading.Thread(target=self.run, name="ExpansionWorker", daemon=True)
+        self.thread.start()
+
+    def submit(self, injector, erase_count, snippet):
+        """
+        Submit an expansion, unless one is already in flight.
+
+        Parameters:
+        - injector: The TextInjector to write the expansion with.
+        - erase_count: The number of typed characters to erase.
+        - snippet: The Snippet to expand.
+
+        Returns:
+        - True: If the expansion was submitted
+        - False: If another expansion is still in flight
+        """
+        with self.lock:
+            if self.busy.is_set():
+                return False
+            self.busy.set()
+        self.jobs.put((injector, erase_count, snippet))
+        return True
+
+    def hold_key(self, key):
+        """
+        Hold a key if an expansion is in flight. Called from the keyboard hook thread.
+
+        Parameters:
+        - key: The key, as a tuple whose first item is the key name.
+
+        Returns:
+        - True: If the key is held, and will be passed to on_done if the user typed it
+        - False: If no expansion is in flight
+        """
+        with self.lock:
+            if not self.busy.is_set():
+                return False
+            self.held_keys.append(key)
+            return True
+
+    @staticmethod
+    def typed_keys(keys, generated_keys):
+        """
+        Pick out the keys the user typed from the keys received while an expansion was written.
+
+        The keys the expansion pressed are reported in the order it pressed them, so they are matched against it
+        in order. Any number of them may be missing, for characters the hook reports under another name or not at
+        all, so each key is matched against the rest of the expansion's keys. A key the user typed that the
+        expansion also presses later is taken for the expansion's, so keys are dropped rather than replayed when
+        in doubt.
+
+        Parameters:
+        - keys: The held keys, as tuples whose first item is the key name.
+        - generated_keys: The names of the keys the expansion pressed, from TextInjector.key_names.
+
+        Returns:
+        - typed: The held keys that were not generated by the expansion, in order.
+        """
+        typed = []
+        position = 0
+        for key in keys:
+            name = key[0]
+            if name in MODIFIER_KEY_NAMES:
+                continue  # Held down to type a character, by the expansion or the user
+            try:
+                position = generated_keys.index(name.casefold(), position) + 1
+            except ValueError:
+                typed.append(key)
+        return typed
+
+    def stop(self):
+        """
+        Stop the worker thread once the expansion in flight, if any, has been written.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.jobs.put(None)
+
+    def run(self):
+        """
+        Write submitted expansions. Runs on the worker thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            injector, erase_count, snippet = job
+            self.generated_keys = []
+            try:
+                text = snippet.render(injector.backend.get_clipboard)  # Loads the text if it was left in the XML file
+                self.generated_keys = injector.key_names(erase_count, text)
+                injector.inject(erase_count, text)
+            except Exception as e:
+                print(f"Error while expanding snippet: {e}")
+            finally:
+                # Let the keyboard hook receive the keystrokes generated by the expansion before passing keys on again
+                time.sleep(EXPANSION_SETTLE_DELAY)
+                with self.lock:
+                    self.on_done(self.typed_keys(self.held_keys, self.generated_keys))
+                    self.held_keys = []
+                    self.busy.clear()
+
+class Template:
+    __slots__ = ('path', 'image', 'width', 'height', 'grayscale', 'searches', 'hits', 'search_time')
+
+    def __init__(self, path, image, grayscale):
+        """
+        Initialize the Template class.
+
+        A Template is a decoded automation image, ready to be searched for on screen.
+
+        Parameters:
+        - path: The path to the image file, which also identifies the image in saved locations.
+        - image: The decoded image, a numpy array if OpenCV is available, otherwise a PIL image, or None if
+                 the image could not be loaded.
+        - grayscale: Whether the image was converted to grayscale, in which case screen captures are as well.
+
+        Returns:
+        None
+        """
+        self.path = path
+        self.image = image
+        if image is None:
+            self.width = self.height = 0
+        elif cv2 is not None:
+            self.height, self.width = image.shape[:2]
+        else:
+            self.width, self.height = image.size
+        self.grayscale = grayscale
+        self.searches = 0  # Number of times the image was searched for
+        self.hits = 0  # Number of times the image was found
+        self.search_time = 0.0  # Seconds spent searching for the image
+
+    def __repr__(self):
+        return f"Template({self.path!r})"
+
+class TemplateBank:
+    def __init__(self, directory, grayscale=False):
+        """
+        Initialize the TemplateBank class.
+
+        Every image under the directory is loaded and decoded once, so screen automation steps search for
+        ready-made Templates instead of reading and decoding the image files on every search. The images are
+        loaded by load(), or on first use.
+
+        Parameters:
+        - directory: The directory containing the automation images.
+        - grayscale: (optional) Whether to convert the images, and the screen captures they are searched in,
+                     to grayscale. Matching is faster but cannot tell apart images that only differ in color.
+
+        Returns:
+        None
+        """
+        self.directory = directory
+        self.grayscale = grayscale
+        self.templates = None  # Templates by image name, without extension, once loaded
+        self.lock = threading.Lock()  # Held while the images are loaded, which may happen on a background thread
+
+    def load(self):
+        """
+        Load and decode every image under the directory, replacing the loaded Templates.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self.load_templates()
+
+    def ensure_loaded(self):
+        """
+        Load the images if they have not been loaded yet, waiting for a load in progress on another thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        with self.lock:
+            if self.templates is None:
+                self.load_templates()
+
+    def load_templates(self):
+        """
+        Load and decode every image under the directory. The lock must be held.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        load_automation()
+        templates = {}
+        try:
+            file_names = sorted(os.listdir(self.directory))
+        except OSError as e:
+            print(f"Error reading images: {e}")
+            file_names = []
+        for file_name in file_names:
+            name, extension = os.path.splitext(file_name)
+            if extension.lower() == '.png':
+                templates[name] = self.load_template(f"{self.directory}/{file_name}")
+        self.templates = templates
+
+    def load_template(self, path):
+        """
+        Load and decode one image.
+
+        Parameters:
+        - path: The path to the image file.
+
+        Returns:
+        - template: The Template, with no image if it could not be loaded.
+        """
+        try:
+            with Image.open(path) as image:
+                image = image.convert('L' if self.grayscale else 'RGB')
+            if cv2 is not None:
+                # Hand OpenCV the array it would otherwise convert the image to on every search
+                image = numpy.array(image)
+                if not self.grayscale:
+                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        except OSError as e:
+            print(f"Error loading image {path}: {e}")
+            image = None
+        return Template(path, image, self.grayscale)
+
+    def set_grayscale(self, grayscale):
+        """
+        Reload the images if grayscale matching has been turned on or off.
+
+        Parameters:
+        - grayscale: Whether to convert the images to grayscale.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            if grayscale != self.grayscale:
+                self.grayscale = grayscale
+                if self.templates is not None:
+                    self.load_templates()
+
+    def __getitem__(self, name):
+        """
+        Get the Template of an image.
+
+        Parameters:
+        - name: The name of the image, without directory and extension.
+
+        Returns:
+        - template: The Template, with no image if there is no such image file.
+        """
+        self.ensure_loaded()
+        template = self.templates.get(name)
+        if template is None:
+            print(f"Error loading image {name}: not found under {self.directory}")
+            template = self.templates[name] = Template(f"{self.directory}/{name}.png", None, self.grayscale)
+        return template
+
+    def stats(self):
+        """
+        Get the search statistics of every image.
+
+        Parameters:
+        None
+
+        Returns:
+        - stats: A dictionary mapping image names to (searches, hits, mean search time in seconds) tuples.
+        """
+        return {name: (template.searches, template.hits, template.search_time / template.searches if template.searches else 0.0)
+                for name, template in (self.templates or {}).items()}
+
+class TemplateMatcher:
+    def __init__(self, backend, locations=None):
+        """
+        Initialize the TemplateMatcher class.
+
+        Each step of the screen automation captures the screen once and searches that single frame for every
+        template the step may need, instead of capturing the screen again for each image it looks for.
+
+        Images that were found before are first searched for in a small region around where they were last seen,
+        and only searched for on the full screen if they are not there.
+
+        Parameters:
+        - backend: The InputBackend to capture the screen and click with.
+        - locations: (optional) A dictionary mapping image paths to the box they were last found at.
+
+        Returns:
+        None
+        """
+        self.backend = backend
+        self.locations = dict(locations or {})  # Last box each image was found at, in screen coordinates
+        self.locations_changed = False  # Set when locations needs to be saved
+        self.screen_size = None  # (width, height) of the screen the locations were last checked against
+        self.captures = 0  # Number of screen captures taken
+        self.searches = 0  # Number of template searches run on those captures
+        self.region_hits = 0  # Images found in the region around their last location
+        self.region_misses = 0  # Images searched for around their last location that had to be searched again
+        self.clicked_at = 0.0  # time.perf_counter() of the last click
+        self.wait_latency = {}  # LatencyHistogram of the time waited for each image, by image path
+        self.wait_timeouts = {}  # Number of times each image did not appear in time, by image path
+
+    def capture(self, region=None):
+        """
+        Capture the screen.
+
+        Parameters:
+        - region: (optional) The (left, top, width, height) box to capture instead of the full screen.
+
+        Returns:
+        The screenshot as a PIL image.
+        """
+        self.captures += 1
+        start_time = time.perf_counter()
+        screen = self.backend.screenshot(region)
+        DIAGNOSTICS.record('screen_capture', time.perf_counter() - start_time)
+        return screen
+
+    def search_region(self, templates):
+        """
+        Get the region around the last locations of several images.
+
+        Parameters:
+        - templates: The Templates of the images, which must all have a last location.
+
+        Returns:
+        The (left, top, width, height) box covering every last location plus TEMPLATE_REGION_MARGIN on each side.
+        """
+        boxes = [self.locations[template.path] for template in templates]
+        left = max(0, min(box[0] for box in boxes) - TEMPLATE_REGION_MARGIN)
+        top = max(0, min(box[1] for box in boxes) - TEMPLATE_REGION_MARGIN)
+        right = min(self.screen_size[0], max(box[0] + box[2] for box in boxes) + TEMPLATE_REGION_MARGIN)
+        bottom = min(self.screen_size[1], max(box[1] + box[3] for box in boxes) + TEMPLATE_REGION_MARGIN)
+        return (left, top, right - left, bottom - top)
+
+    def check_locations(self):
+        """
+        Forget the last locations that do not fit on the screen, such as those saved with a larger monitor or
+        another monitor layout, whenever the screen size changes.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        screen_size = tuple(self.backend.screen_size())
+        if screen_size == self.screen_size:
+            return
+        self.screen_size = screen_size
+
+        width, height = screen_size
+        offscreen = [path for path, box in self.locations.items()
+                     if box[0] < 0 or box[1] < 0 or box[0] + box[2] > width or box[1] + box[3] > height]
+        for path in offscreen:
+            del self.locations[path]
+        if offscreen:
+            self.locations_changed = True
+
+    def locate(self, template, screen, conf):
+        """
+        Locate an image in a screen capture.
+
+        Parameters:
+        - template: The Template of the image.
+        - screen: The screen capture to search.
+        - conf: The accuracy level of locating the image.
+
+        Returns:
+        The (left, top, width, height) box of the image, or None if it was not found.
+        """
+        if template.image is None:
+            return None
+        self.searches += 1
+        template.searches += 1
+        start = time.perf_counter()
+        try:
+            box = pyscreeze.locate(template.image, screen, confidence=conf, grayscale=template.grayscale)
+        except pyscreeze.ImageNotFoundException:
+            box = None
+        except Exception as e:
+            print("Error while processing image:", str(e))
+            box = None
+        template.search_time += time.perf_counter() - start
+        DIAGNOSTICS.record('template_search', time.perf_counter() - start)
+        if box is not None:
+            template.hits += 1
+        return box
+
+    def locate_all(self, templates, full_screen=True):
+        """
+        Capture the screen once and locate several images in that capture.
+
+        Images with a last location are searched for in a capture of the region around those locations. The full
+        screen is only captured if full_screen is set and some images have no last location or were not found in
+        that region.
+
+        Parameters:
+        - templates: A dictionary mapping Templates to the accuracy level of locating them.
+        - full_screen: (optional) Whether to search the full screen for images without a last location or not found
+                       around it. If not, only images with a last location are searched for.
+
+        Returns:
+        A dictionary mapping each Template to its box on screen, or to None if it was not found.
+        """
+        locations = dict.fromkeys(templates)
+        try:
+            self.check_locations()
+            remembered = [template for template in templates if template.path in self.locations]
+            if remembered:
+                region = self.search_region(remembered)
+                screen = self.capture(region)
+                for template in remembered:
+                    box = self.locate(template, screen, templates[template])
+                    if box is not None:
+                        # Convert the box from region to screen coordinates
+                        locations[template] = (box[0] + region[0], box[1] + region[1], box[2], box[3])
+                        self.region_hits += 1
+                    else:
+                        self.region_misses += 1
+
+            missing = [template for template, box in locations.items()
+                       if box is None and template.image is not None and full_screen]
+            if missing:
+                screen = self.capture()
+                for template in missing:
+                    locations[template] = self.locate(template, screen, templates[template])
+        except Exception as e:
+            print("Error while capturing screen:", str(e))
+            return locations
+
+        for template, box in locations.items():
+            if box is not None and self.locations.get(template.path) != box:
+                self.locations[template.path] = tuple(box)
+                self.locations_changed = True
+        return locations
+
+    def click(self, location):
+        """
+        Click the center of a box located on screen.
+
+        Parameters:
+        - location: The box to click, or None.
+
+        Returns:
+        - True: If the box was clicked
+        - False: If there was no box to click
+        """
+        if location is None:
+            return False
+        image_center = pyscreeze.center(location)
+        self.backend.click(image_center[0], image_center[1])
+        self.clicked_at = self.backend.clock()
+        return True
+
+    def click_image(self, template, conf):
+        """
+        Capture the screen and click an image on it.
+
+        Parameters:
+        - template: The Template of the image.
+        - conf: The accuracy level of locating the image.
+
+        Returns:
+        - True: If the image is clicked
+        - False: If the image is not clicked
+        """
+        return self.click(self.locate_all({template: conf})[template])
+
+    def wait_for(self, template, conf, timeout, cancel=None):
+        """
+        Wait for an image to appear on screen.
+
+        The region around the image's last location is searched every WAIT_POLL_INTERVAL, and the full screen
+        every WAIT_FULL_SCREEN_INTERVAL, so the wait ends as soon as the page shows the image. An image without a
+        last location is searched for on the full screen right away, then every WAIT_FULL_SCREEN_INTERVAL.
+
+        Parameters:
+        - template: The Template of the image.
+        - conf: The accuracy level of locating the image.
+        - timeout: The number of seconds to wait for the image before giving up.
+        - cancel: (optional) A threading.Event that stops the wait when set.
+
+        Returns:
+        The (left, top, width, height) box of the image, or None if it did not appear in time or the wait was cancelled.
+        """
+        # Give the page a moment to react to the last click, so the image is not found on the page being left
+        settle = self.clicked_at + AUTOMATION_SETTLE_DELAY - self.backend.clock()
+        if settle > 0:
+            self.backend.sleep(settle)
+
+        start = self.backend.clock()
+        deadline = start + timeout
+        last_full_screen = None  # Time of the last full screen search, if any
+        while True:
+            now = self.backend.clock()
+            if last_full_screen is None:
+                # An image without a last location, including one just dropped as off the screen, can only be
+                # searched for on the full screen, so do that at once
+                full_screen = template.path not in self.locations or now - start >= WAIT_FULL_SCREEN_INTERVAL
+            else:
+                full_screen = now - last_full_screen >= WAIT_FULL_SCREEN_INTERVAL
+            full_screen = full_screen or now >= deadline
+            box = self.locate_all({template: conf}, full_screen)[template]
+            if full_screen:
+                last_full_screen = now
+            if box is not None or now >= deadline:
+                break
+            if cancel is not None and cancel.is_set():
+                return None
+            self.backend.sleep(WAIT_POLL_INTERVAL)
+
+        waited = self.backend.clock() - start
+        self.wait_latency.setdefault(template.path, LatencyHistogram()).record(waited)
+        DIAGNOSTICS.record('template_wait', waited)
+        if box is None:
+            self.wait_timeouts[template.path] = self.wait_timeouts.get(template.path, 0) + 1
+        return box
+
+    def wait_and_click(self, template, conf, timeout, cancel=None):
+        """
+        Wait for an image to appear on screen and click it.
+
+        Parameters:
+        - template: The Template of the image.
+        - conf: The accuracy level of locating the image.
+        - timeout: The number of seconds to wait for the image before giving up.
+        - cancel: (optional) A threading.Event that stops the wait when set.
+
+        Returns:
+        - True: If the image is clicked
+        - False: If the image did not appear in time or the wait was cancelled
+        """
+        return self.click(self.wait_for(template, conf, timeout, cancel))
+
+    def stats(self):
+        """
+        Get the matcher statistics.
+
+        Parameters:
+        None
+
+        Returns:
+        - stats: A dictionary with the number of screen captures and searches, and of images found or not found around their last location.
+        """
+        return {'captures': self.captures, 'searches': self.searches, 'region_hits': self.region_hits, 'region_misses': self.region_misses}
+
+    def wait_stats(self):
+        """
+        Get the statistics of the time waited for each image.
+
+        Parameters:
+        None
+
+        Returns:
+        - stats: A dictionary mapping image paths to their LatencyHistogram summary plus a 'timeouts' count.
+        """
+        return {path: dict(histogram.summary(), timeouts=self.wait_timeouts.get(path, 0))
+                for path, histogram in self.wait_latency.items()}
+
+class AutoCloseJob:
+    # States of the auto close state machine, named after the step they perform
+    SELECT_ISSUE = 'opening issues'
+    SELECT_FIRST = 'selecting first issue'
+    OPEN_TAB_MENU = 'opening tab menu'
+    CLOSE = 'closing issue'
+    CONFIRM = 'confirming'
+    NEXT = 'going to next issue'
+    FINISH = 'returning to case overview'
+    DONE = 'done'
+
+    def __init__(self, matcher, images, timeout, on_progress, on_done):
+        """
+        Initialize the AutoCloseJob class.
+
+        The job closes all open issues on a background thread, one state machine step at a time, so it can be
+        followed and cancelled from the window.
+
+        Parameters:
+        - matcher: The TemplateMatcher to locate and click the images with.
+        - images: The TemplateBank of the automation images.
+        - timeout: The number of seconds each step waits for its image.
+        - on_progress: The function to call with the job before each step, on the job thread.
+        - on_done: The function to call with the job once it has finished, on the job thread.
+
+        Returns:
+        None
+        """
+        self.matcher = matcher
+        self.backend = matcher.backend  # Its clock times the job, so a replayed job is timed in replay time
+        self.images = images
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = threading.Event()
+
+        self.state = self.SELECT_ISSUE
+        self.confirm = False  # Whether closing the current issue asks for confirmation
+        self.issue_started = 0.0  # backend.clock() when work on the current issue started
+        self.issues_closed = 0
+        self.retries = 0  # Number of steps whose image had to be waited for again
+        self.issue_time = LatencyHistogram()  # Seconds taken to close each issue
+        self.elapsed = 0.0
+        self.outcome = 'finished'
+
+        self.thread = threading.Thread(target=self.run, name="AutoCloseJob", daemon=True)
+
+    def start(self):
+        """
+        Start the job thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stop the job before its next click. Safe to call from any thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.cancelled.set()
+
+    def running(self):
+        """
+        Check if the job is still running.
+
+        Parameters:
+        None
+
+        Returns:
+        - True: If the job thread is running
+        - False: If the job has finished or has not been started
+        """
+        return self.thread.is_alive()
+
+    def click_step(self, template, next_state):
+        """
+        Wait for an image and click it, waiting again up to AUTO_CLOSE_RETRIES times if it does not appear.
+
+        Parameters:
+        - template: The Template of the image.
+        - next_state: The state to move to once the image is clicked.
+
+        Returns:
+        - state: next_state, or DONE if the image never appeared or the job was cancelled.
+        """
+        for attempt in range(AUTO_CLOSE_RETRIES + 1):
+            if attempt:
+                self.retries += 1
+            if self.matcher.wait_and_click(template, 0.99, self.timeout, self.cancelled):
+                return next_state
+            if self.cancelled.is_set():
+                return self.DONE
+
+        self.outcome = f"stopped, {os.path.basename(template.path)} did not appear"
+        return self.DONE
+
+    def issue_done(self):
+        """
+        Count the current issue as closed.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.issues_closed += 1
+        issue_time = self.backend.clock() - self.issue_started
+        self.issue_time.record(issue_time)
+        DIAGNOSTICS.record('auto_close_issue', issue_time)
+
+    def step(self):
+        """
+        Perform the step of the current state.
+
+        Parameters:
+        None
+
+        Returns:
+        - state: The state to move to.
+        """
+        images = self.images
+
+        if self.state == self.SELECT_ISSUE:
+            # Select the first issue, whether or not the issue list is already open
+            found = self.matcher.locate_all({images['issue']: 0.99, images['issue_selected']: 0.99})
+            if self.matcher.click(found[images['issue']]) or self.matcher.click(found[images['issue_selected']]):
+                self.issue_started = self.backend.clock()
+                return self.SELECT_FIRST
+            return self.NEXT
+
+        if self.state == self.SELECT_FIRST:
+            return self.click_step(images['first'], self.OPEN_TAB_MENU)
+
+        if self.state == self.OPEN_TAB_MENU:
+            return self.click_step(images['tab_menu'], self.CLOSE)
+
+        if self.state == self.CLOSE:
+            if self.confirm:
+                return self.click_step(images['close_issue'], self.CONFIRM)
+            next_state = self.click_step(images['close_issue'], self.NEXT)
+            if next_state == self.NEXT:
+                self.issue_done()
+            return next_state
+
+        if self.state == self.CONFIRM:
+            next_state = self.click_step(images['yes'], self.NEXT)
+            if next_state == self.NEXT:
+                self.issue_done()
+            return next_state
+
+        if self.state == self.NEXT:
+            # Issues reached with the next button ask for confirmation when they are closed
+            if self.matcher.wait_and_click(images['next'], 0.99, self.timeout, self.cancelled):
+                self.issue_started = self.backend.clock()
+                self.confirm = True
+                return self.OPEN_TAB_MENU
+            return self.FINISH
+
+        if self.state == self.FINISH:
+            self.matcher.click_image(images['case_overview'], 0.99)
+            return self.DONE
+
+        return self.DONE
+
+    def run(self):
+        """
+        Run the state machine until all issues are closed or the job is cancelled. Runs on the job thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        started = self.backend.clock()
+        try:
+            while self.state != self.DONE:
+                if self.cancelled.is_set():
+                    break
+                self.on_progress(self)
+                self.state = self.step()
+        except self.backend.failsafe_exception:
+            self.outcome = "stopped by the failsafe"
+        except Exception as e:
+            print(f"Error while closing issues: {e}")
+            self.outcome = f"stopped by an error: {e}"
+        if self.cancelled.is_set():
+            self.outcome = "cancelled"
+
+        self.elapsed = self.backend.clock() - started
+        self.state = self.DONE
+        self.on_done(self)
+
+    def summary(self):
+        """
+        Describe the result of the job.
+
+        Parameters:
+        None
+
+        Returns:
+        - summary: The number of issues closed, the time per issue and the retries, and how the job ended.
+        """
+        issues = "issue" if self.issues_closed == 1 else "issues"
+        retries = "retry" if self.retries == 1 else "retries"
+        summary = f"Closed {self.issues_closed} {issues} in {self.elapsed:.1f} s"
+        if self.issues_closed:
+            summary += f" ({self.issue_time.total / self.issues_closed:.1f} s per issue, {self.retries} {retries})"
+        else:
+            summary += f" ({self.retries} {retries})"
+        if self.outcome != 'finished':
+            summary += f", {self.outcome}"
+        return summary
+
+class NotatorAssistant:
+    def __init__(self, root, snippets_data, settings_data, keyword_index=None, backend=None):
+        """
+        Initialize the NotatorAssistant class.
+
+        Parameters:
+        - root: The root Tkinter window.
+        - snippets_data: Dictionary containing snippet data.
+        - settings_data: Settings object containing application settings.
+        - keyword_index: (optional) A prebuilt KeywordIndex of the snippet keywords, e.g. from the snapshot cache.
+        - backend: (optional) The InputBackend for keys, clicks, text and the screen. Defaults to the desktop.
+
+        Returns:
+        None
+        """
+        # Initialize the NotatorAssistant class with the given root window
+        # Set the root window title
+        self.root = root
+        self.root.title("Notator Assistant")
+
+        # Set the icon for the root window
+        icon_path = "feather_quill_pen_write_sign_icon_124655.ico"
+        root.iconbitmap(icon_path)
+
+        # Set up everything that handles keystrokes and saves snippets, which does not need the window
+        self.setup_engine(snippets_data, settings_data, xml_file, keyword_index, backend)
+
+        # Decode the screen automation images once, after the window is up, and locate them with one screen capture per step
+        self.template_bank = TemplateBank('img', self.settings_data.grayscale_matching)
+        self.template_matcher = TemplateMatcher(self.backend, read_template_locations(locations_file))
+        self.auto_close_job = None  # The AutoCloseJob closing issues in the background, if any
+        self.auto_fill_thread = None  # The thread filling in the case categories, if any
+
+        self.root.after_idle(self.report_keyword_collisions)
+
+
+        # Create and pack four frames for organizing widgets
+        self.frame1 = tk.Frame(root, padx=10, pady=5)
+        self.search_frame = tk.Frame(root, padx=10)
+        self.frame2 = tk.Frame(root, padx=10, pady=5)
+        self.frame3 = tk.Frame(root, padx=10, pady=5)
+
+        self.frame1.pack(side="top", fill="both", expand=True)
+        self.search_frame.pack(side="top", fill="both", expand=True)
+        self.frame2.pack(side="top", fill="both", expand=True)
+        self.frame3.pack(side="top", fill="both", expand=True)
+
+        # Buttons for snippet management
+        self.add_button = tk.Button(self.frame1, text="Add Snippet", command=self.add_snippet)
+        self.add_button.pack(side='left', padx=2)
+
+        self.edit_button = tk.Button(self.frame1, text="Edit Snippet", command=self.edit_snippet)
+        self.edit_button.pack(side='left', padx=2)
+
+        self.remove_button = tk.Button(self.frame1, text="Remove Snippet", command=self.remove_snippet)
+        self.remove_button.pack(side='left', padx=2)
+
+        self.clear_button = tk.Button(self.frame1, text="Clear Jam", command=self.clear_modifiers)
+        self.clear_button.pack(side='right', padx=2)
+
+        self.fill_button = tk.Button(self.frame1, text="Auto Fill (Ctrl+`)", command=self.auto_fill_categories)
+        self.fill_button.pack(side='right', padx=2)
+
+        self.close_button = tk.Button(self.frame1, text="Auto Close (Alt+`)", command=self.auto_close_issues)
+        self.close_button.pack(side='right', padx=2)
+
+        # Progress of the auto close job, shown below the buttons while it runs and until its summary is dismissed
+        self.job_frame = tk.Frame(root, padx=10)
+        self.job_progressbar = ttk.Progressbar(self.job_frame, mode='indeterminate', length=120)
+        self.job_progressbar.pack(side='left', padx=2)
+        self.job_label = tk.Label(self.job_frame, text="")
+        self.job_label.pack(side='left', padx=2)
+        self.job_button = tk.Button(self.job_frame, text="Cancel", command=self.cancel_auto_close)
+        self.job_button.pack(side='right', padx=2)
+
+        # Search box for filtering the Treeview by keyword prefix or by words in the snippets
+        self.search_index = SearchIndex(self.snippets_data, on_ready=lambda: self.post_ui_event(self.on_search_index_ready))
+        self.search_after_id = None  # Pending Tk callback that applies the search
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', self.on_search_change)
+
+        tk.Label(self.search_frame, text="Search:").pack(side='left', padx=2)
+        self.search_entry = tk.Entry(self.search_frame, textvariable=self.search_var, width=40)
+        self.search_entry.pack(side='left', padx=2)
+        self.search_count_label = tk.Label(self.search_frame, text="")
+        self.search_count_label.pack(side='left', padx=2)
+
+        # Treeview for displaying snippets with scrollbar
+        # Only the visible rows are inserted into the Treeview, rendered from tree_keywords as it is scrolled
+        self.tree = ttk.Treeview(self.frame2, columns=('Keyword', 'Text'), show='headings', height=TREE_ROWS, selectmode='browse')
+        self.tree.heading('Keyword', text='Keyword', command=lambda: self.sort_treeview('Keyword', False))
+        self.tree.heading('Text', text='Text', command=lambda: self.sort_treeview('Text', False))
+        self.tree.column('Keyword', width=100)
+        self.tree.column('Text', width=800)
+
+        self.tree_order = list(snippets_data)  # Keywords of all snippets in display order
+        self.tree_keywords = self.tree_order  # Keywords of the rows matching the search, in display order
+        self.tree_top = 0  # Index in tree_keywords of the first visible row
+        self.selected_keyword = None  # Keyword of the selected row, which may be scrolled out of view
+        self.sort_cache = {}  # (column, reverse) -> sorted keywords, cleared whenever the snippets change
+
+        # Scrollbar for the Treeview, driven by the position in tree_keywords
+        self.tree_scrollbar = ttk.Scrollbar(self.frame2, orient="vertical", command=self.tree_yview)
+
+        # Pack the Treeview and scrollbar
+        self.tree.pack(side="left", pady=5)
+        self.tree_scrollbar.pack(side="left", fill="y", pady=5)
+
+        # Populate the Treeview with the first rows of snippet data
+        self.render_tree()
+
+        # Text widget for displaying snippet details with scrollbar
+        self.text_display = tk.Text(self.frame3, height=10, width=112, wrap='word', state='disabled')
+
+        # Scrollbar for the Text widget
+        self.text_scrollbar = ttk.Scrollbar(self.frame3, orient="vertical", command=self.text_display_yview)
+        self.text_display.configure(yscrollcommand=self.text_scrollbar.set)
+
+        # Pack the Text widget and scrollbar
+        self.text_display.pack(side="left", pady=5)
+        self.text_scrollbar.pack(side="left", fill="y", pady=5)
+
+        # Register the keyboard events
+        self.hook_keyboard()
+
+        # Bind the TreeView selection event to update the Text widget
+        self.tree.bind("<ButtonRelease-1>", self.on_tree_click)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+
+        # Bind scrolling and keyboard navigation of the TreeView to scroll through tree_keywords
+        self.tree.bind("<MouseWheel>", self.on_tree_mousewheel)
+        self.tree.bind("<Button-4>", self.on_tree_mousewheel)
+        self.tree.bind("<Button-5>", self.on_tree_mousewheel)
+        self.tree.bind("<Up>", self.on_tree_key)
+        self.tree.bind("<Down>", self.on_tree_key)
+        self.tree.bind("<Prior>", self.on_tree_key)
+        self.tree.bind("<Next>", self.on_tree_key)
+
+        # Bind the window close event to the method that unhooks the keyboard
+        root.protocol("WM_DELETE_WINDOW", self.on_window_close)
+
+        self.create_menu()
+
+        # Report the statistics every component keeps of itself in the diagnostics
+        self.diagnostics_window = None
+        DIAGNOSTICS.add_source('snippets', lambda: {'count': len(self.snippets_data)})
+        DIAGNOSTICS.add_source('ui_events', self.ui_event_stats)
+        DIAGNOSTICS.add_source('timeout_timer', self.timeout_timer.jitter_stats)
+        DIAGNOSTICS.add_source('snippet_writer', self.snippet_writer.stats)
+        DIAGNOSTICS.add_source('injection_chars_per_s', lambda: {name: injector.throughput() for name, injector in self.text_injectors.items()})
+        DIAGNOSTICS.add_source('template_matcher', self.template_matcher.stats)
+        DIAGNOSTICS.add_source('template_waits_ms', lambda: {
+            path: f"p50 {stats['p50'] * 1000:.0f}, p90 {stats['p90'] * 1000:.0f}, {stats['timeouts']} timeouts"
+            for path, stats in self.template_matcher.wait_stats().items()})
+        DIAGNOSTICS.add_source('auto_close', lambda: {'last_job': self.auto_close_job.summary() if self.auto_close_job else None})
+        DIAGNOSTICS.add_source('startup_ms', lambda: {name: seconds * 1000 for name, seconds in self.startup_times.items()})
+
+        # Start handling the events posted from other threads
+        self.ui_event_poll_ms = UI_EVENT_POLL_MS
+        self.root.after(self.ui_event_poll_ms, self.drain_ui_events)
+
+        # Load the mouse hook and the screen automation once the window is up
+        self.root.after_idle(self.on_window_shown)
+
+    def setup_engine(self, snippets_data, settings_data, xml_file, keyword_index=None, backend=None):
+        """
+        Set up the parts of the assistant that follow keystrokes, expand snippets and save snippet edits, none of
+        which need the window. Called by __init__ and headless.
+
+        Parameters:
+        - snippets_data: Dictionary containing snippet data.
+        - settings_data: Settings object containing application settings.
+        - xml_file: The path to the XML file snippet edits are saved to.
+        - keyword_index: (optional) A prebuilt KeywordIndex of the snippet keywords, e.g. from the snapshot cache.
+        - backend: (optional) The InputBackend for keys, clicks, text and the screen. Defaults to the desktop.
+
+        Returns:
+        None
+        """
+        # Queue of events posted by the keyboard, mouse and worker threads, handled on the Tk thread
+        self.ui_events = queue.SimpleQueue()
+        self.ui_event_count = 0
+        self.total_ui_event_latency = 0.0
+        self.max_ui_event_latency = 0.0
+
+        self.current_word = ""  # Track the currently typed word
+        self.current_category = ""
+        self.current_subcategory = ""
+        self.current_reason = ""
+        self.snippets_data = snippets_data
+        self.settings_data = settings_data
+        self.snippet_writer = SnippetWriter(xml_file, snippets_data, lambda error: self.post_ui_event(self.show_save_error, error))  # Writes snippet edits to the XML file in the background
+        self.backend = backend if backend is not None else DesktopBackend()  # Keys, clicks, text and the screen
+
+        # Create one injector per expansion method so each keeps its own throughput measurements
+        self.text_injectors = {name: injector(self.backend) for name, injector in TEXT_INJECTORS.items()}
+
+        # Seconds after STARTUP_TIME at which each part of the program became ready
+        self.startup_times = {}
+
+        # Start the worker that writes expansions off the keyboard hook thread
+        self.expansion_worker = ExpansionWorker(lambda typed_keys: self.post_ui_event(self.on_expansion_done, time.perf_counter(), typed_keys))
+
+        # Build the keyword matcher that follows the typed word one keypress at a time
+        self.keyword_matcher = KeywordMatcher(snippets_data, self.settings_data.keyword_case_sensitive, keyword_index)
+
+        # Initialize the timeout timer, a single worker thread shared by every keystroke, and start it
+        self.timeout_timer = DeadlineTimer(lambda: self.post_ui_event(self.reset_current_word))
+        self.start_timeout_timer()
+
+    @classmethod
+    def headless(cls, snippets_data, settings_data, xml_file, backend, keyword_index=None):
+        """
+        Create a NotatorAssistant without a window, on a backend such as the TraceReplayBackend, e.g. for benchmarks.
+
+        Keystrokes and snippet edits go through the same code as in the windowed assistant. Events posted from
+        other threads are handled when handle_ui_events is called, and stop_engine stops the background threads.
+
+        Parameters:
+        - snippets_data: Dictionary containing snippet data.
+        - settings_data: Settings object containing application settings.
+        - xml_file: The path to the XML file snippet edits are saved to.
+        - backend: The InputBackend to hook and expand into.
+        - keyword_index: (optional) A prebuilt KeywordIndex of the snippet keywords.
+
+        Returns:
+        - engine: The NotatorAssistant.
+        """
+        engine = cls.__new__(cls)
+        engine.setup_engine(snippets_data, settings_data, xml_file, keyword_index, backend)
+        engine.hook_keyboard()
+        backend.hook_clicks(engine.on_mouse_click)
+        return engine
+
+    def hook_keyboard(self):
+        """
+        Start receiving key presses from the backend, and note when that happened.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.backend.hook_keys(self.on_key_press)
+        self.startup_times['keyboard_hook'] = time.perf_counter() - STARTUP_TIME
+
+    def stop_engine(self):
+        """
+        Remove the keyboard and mouse hooks, write pending snippet edits and stop the background threads.
+
+        Parameters:
+        None
+
+        Returns:
+        - error: The error message if the snippet edits could not be written, None otherwise.
+        """
+        self.backend.unhook_all()
+        save_error = self.snippet_writer.close()
+        self.timeout_timer.stop()
+        self.expansion_worker.stop()
+        return save_error
+
+    def on_window_shown(self):
+        """
+        Start loading the screen automation in the background, once the window is shown and keystrokes are
+        being handled. Runs on the Tk thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.startup_times['window'] = time.perf_counter() - STARTUP_TIME
+        threading.Thread(target=self.load_automation_in_background, name="AutomationLoader", daemon=True).start()
+
+    def load_automation_in_background(self):
+        """
+        Import the screen automation stack, hook the mouse and decode the automation images. Runs on its own thread.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        try:
+            import_time = load_automation()
+
+            # Bind left mouse button click event to reset_current_word
+            self.backend.hook_clicks(self.on_mouse_click)
+
+            self.template_bank.ensure_loaded()
+        except Exception as e:
+            print(f"Error loading screen automation: {e}")
+            return
+        self.post_ui_event(self.report_startup, import_time, time.perf_counter() - STARTUP_TIME)
+
+    def report_startup(self, import_time, automation_time):
+        """
+        Print how long the program took to start. Runs on the Tk thread.
+
+        Parameters:
+        - import_time: The seconds spent importing the screen automation stack.
+        - automation_time: The seconds after STARTUP_TIME at which the screen automation was ready.
+
+        Returns:
+        None
+        """
+        self.startup_times['automation_import'] = import_time
+        self.startup_times['automation'] = automation_time
+        print(f"Expansions ready after {self.startup_times['window'] * 1000:.0f} ms "
+              f"(keyboard hook after {self.startup_times['keyboard_hook'] * 1000:.0f} ms), "
+              f"screen automation ready after {automation_time * 1000:.0f} ms (imports took {import_time * 1000:.0f} ms)")
+
+    def on_expansion_done(self, done_time, typed_keys):
+        """
+        Handle the keys the user typed while an expansion was being written, once it has been written, and note
+        how long after startup the first expansion was written, for the diagnostics. Runs on the Tk thread.
+
+        Parameters:
+        - done_time: The time.perf_counter() at which the expansion was written.
+        - typed_keys: The handle_key_press arguments of the keys typed while the expansion was being written.
+
+        Returns:
+        None
+        """
+        if 'first_expansion' not in self.startup_times:
+            self.startup_times['first_expansion'] = done_time - STARTUP_TIME
+        for key in typed_keys:
+            self.handle_key_press(*key)
+
+    def create_menu(self):
+        """
+        Create the menu bar for the application.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        # Create a menu bar
+        menu_bar = tk.Menu(self.root)
+        self.root.config(menu=menu_bar)
+
+        # Create a File menu
+        file_menu = tk.Menu(menu_bar, tearoff=0)
+        menu_bar.add_cascade(label="File", menu=file_menu)
+
+        # Add File menu options
+        file_menu.add_command(label="Add Snippet", command=self.add_snippet)
+        file_menu.add_command(label="Edit Snippet", command=self.edit_snippet)
+        file_menu.add_command(label="Remove Snippet", command=self.remove_snippet)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_window_close)
+
+        # Create an Options menu
+        options_menu = tk.Menu(menu_bar, tearoff=0)
+        menu_bar.add_cascade(label="Options", menu=options_menu)
+
+        # Add Options menu options
+        options_menu.add_command(label="Settings", command=self.edit_settings)
+        options_menu.add_command(label="Diagnostics", command=self.show_diagnostics)
+
+    def show_diagnostics(self):
+        """
+        Open the diagnostics window, or bring it to the front if it is already open.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+        self.diagnostics_window = DiagnosticsWindow(self.root, DIAGNOSTICS)
+
+    def start_timeout_timer(self):
+        """
+        Start the timeout timer.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.timeout_timer.schedule(self.settings_data.timeout_value)
+
+    def reset_timeout_timer(self):
+        """
+        Reset the timeout timer.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.start_timeout_timer()  # Scheduling replaces the pending deadline
+
+    def reset_current_word(self):
+        """
+        Reset the current word when the timeout occurs.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self.current_word = ""
+        self.keyword_matcher.reset()
+
+    def edit_settings(self):
+        """
+        Open the SettingsDialog to edit application settings.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        initial_values = {
+            'keyword_case_sensitive': self.settings_data.keyword_case_sensitive,
+            'reset_on_backspace': self.settings_data.reset_on_backspace,
+            'reset_on_click': self.settings_data.reset_on_click,
+            'reset_on_tab': self.settings_data.reset_on_tab,
+            'timeout_value': f"{self.settings_data.timeout_value:g}",
+            'click_interval': f"{self.settings_data.click_interval:g}",
+            'injection_backend': self.settings_data.injection_backend,
+            'grayscale_matching': self.settings_data.grayscale_matching,
+            'injection_throughput': {name: injector.throughput() for name, injector in self.text_injectors.items()}
+        }
+
+        dialog = SettingsDialog(self.root, "Settings", initial_values=initial_values)
+        result = dialog.result
+
+        if result:
+            # Validate the new settings before publishing them
+            try:
+                settings = Settings(
+                    keyword_case_sensitive=result['case_sensitive'],
+                    reset_on_backspace=result['backspace'],
+                    reset_on_click=result['click'],
+                    reset_on_tab=result['tab'],
+                    timeout_value=float(result['timeout']),
+                    click_interval=float(result['interval']),
+                    injection_backend=result['injection'],
+                    grayscale_matching=result['grayscale']
+                )
+            except ValueError as e:
+                tk.messagebox.showinfo("Invalid Settings", f"The settings could not be saved: {e}")
+                return
+
+            # Publish the new settings with a single assignment
+            self.settings_data = settings
+
+            # Swap in a keyword index for the new case sensitivity if it has changed
+            if settings.keyword_case_sensitive != self.keyword_matcher.case_sensitive:
+                self.keyword_matcher.set_case_sensitive(self.snippets_data, settings.keyword_case_sensitive)
+                self.report_keyword_collisions()
+
+            # Decode the automation images again if grayscale matching has been turned on or off
+            self.template_bank.set_grayscale(settings.grayscale_matching)
+
+            # Save the updated settings to the INI file (if needed)
+            self.save_settings_to_ini()
+
+    def report_keyword_collisions(self):
+        """
+        Warn the user about keywords that cannot be told apart with the current case sensitivity setting.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        collisions = self.keyword_matcher.index.collisions()
+        if collisions:
+            lines = [f"'{keywords[0]}' is used instead of " + ", ".join(f"'{keyword}'" for keyword in keywords[1:]) for keywords in collisions]
+            tk.messagebox.showinfo("Keyword Collision", "Some keywords are the same when case is ignored:\n\n" + "\n".join(lines))
+
+    def save_settings_to_ini(self):
+        """
+        Save the settings to the INI file.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        try:
+            with open(ini_file, 'w') as configfile:  # Open the INI file for writing
+                self.settings_data.to_config().write(configfile)  # Write the settings to the INI file
+        except FileNotFoundError as e:
+            # Handle file not found error
+            print(f"Error saving settings to INI file: {e}")
+
+    def add_snippet(self):
+        """
+        Open the SnippetDialog to add a new snippet.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        dialog = SnippetDialog(self.root, "Add Snippet")
+        result = dialog.result
+
+        if result:
+            keyword, category, subcategory, reason, text = result
+
+            # Check if the keyword contains spaces
+            if ' ' in keyword:
+                tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot contain spaces. Please choose a different keyword.")
+                return
+
+            # Check if the keyword is empty
+            elif keyword == "":
+                tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot be empty. Please enter a keyword.")
+                return
+
+            # Check if the text is empty
+            elif text == "":
+                tk.messagebox.showinfo("Invalid Text", "The text cannot be empty. Please enter some text.")
+                return
+
+            # Check if the keyword already exists in the snippets_data dictionary
+            elif keyword in self.snippets_data:
+                tk.messagebox.showinfo("Duplicate Keyword", f"The keyword '{keyword}' already exists. Please choose a different keyword.")
+                return
+
+            # Check if the keyword collides with an existing keyword when case is ignored
+            elif self.keyword_matcher.index.lookup(keyword) is not None:
+                tk.messagebox.showinfo("Duplicate Keyword", f"The keyword '{keyword}' is the same as '{self.keyword_matcher.index.lookup(keyword)}' when case is ignored. Please choose a different keyword.")
+                return
+
+            else:
+                # Create a Snippet containing category, subcategory, reason, and text
+                snippet_entry = Snippet(category, subcategory, reason, text)
+                    
+                # Add the new snippet to the snippets_data dictionary
+                self.snippets_data[keyword] = snippet_entry
+
+                # Add the new keyword to the keyword matcher
+                self.keyword_matcher.add(keyword)
+                    
+                # Add the new snippet to the search index
+                self.search_index.add(keyword, snippet_entry)
+
+                # Add the new snippet to the end of the TreeView and scroll to it if it matches the search
+                self.sort_cache.clear()
+                self.tree_order.append(keyword)
+                self.selected_keyword = keyword
+                self.filter_tree()
+                if keyword in self.tree_keywords:
+                    self.scroll_tree_to(keyword)
+
+                # Add the new snippet to the XML file
+                self.save_snippet_to_xml(keyword, snippet_entry)
+    
+    def edit_snippet(self):
+        """
+        Open the SnippetDialog to edit an existing snippet.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        keyword = self.selected_keyword
+
+        if keyword is not None:
+            snippet_entry = self.snippets_data[keyword]
+            try:
+                text = snippet_entry.text  # Loads the text if it was left in the XML file
+            except SnippetFileChangedError as e:
+                tk.messagebox.showinfo("Snippets Changed", str(e))
+                return
+
+            # Pre-populate the dialog with the selected snippet values
+            initial_values = {'keyword': keyword, 'category': snippet_entry.category, 'subcategory': snippet_entry.subcategory, 'reason': snippet_entry.reason, 'text': text}
+            dialog = SnippetDialog(self.root, "Edit Snippet", initial_values=initial_values)
+            result = dialog.result
+
+            if result:
+                new_keyword, new_category, new_subcategory, new_reason, new_text = result
+
+                # Check if the new keyword contains spaces
+                if ' ' in new_keyword:
+                    tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot contain spaces. Please choose a different keyword.")
+                    return
+
+                # Check if the new keyword is empty, which would also be the item id of the Treeview's root
+                if new_keyword == "":
+                    tk.messagebox.showinfo("Invalid Keyword", "The keyword cannot be empty. Please enter a keyword.")
+                    return
+
+                # Check if the new text is empty
+                if new_text == "":
+                    tk.messagebox.showinfo("Invalid Text", "The text cannot be empty. Please enter some text.")
+                    return
+
+                # Check if the new keyword already belongs to another snippet
+                if new_keyword != keyword and new_keyword in self.snippets_data:
+                    tk.messagebox.showinfo("Duplicate Keyword", f"The keyword '{new_keyword}' already exists. Please choose a different keyword.")
+                    return
+
+                # Check if the new keyword collides with another snippet's keyword when case is ignored. Keywords that
+                # already collided when loaded can still be edited, as long as the keyword is not changed to another one.
+                keyword_index = self.keyword_matcher.index
+                colliding_keyword = keyword_index.lookup(new_keyword)
+                if colliding_keyword is not None and keyword_index.normalize(new_keyword) != keyword_index.normalize(keyword):
+                    tk.messagebox.showinfo("Duplicate Keyword", f"The keyword '{new_keyword}' is the same as '{colliding_keyword}' when case is ignored. Please choose a different keyword.")
+                    return
+
+                # Create a Snippet containing new_category, new_subcategory, new_reason, and new_text
+                new_snippet_entry = Snippet(new_category, new_subcategory, new_reason, new_text)
+
+                # Update the snippets_data dictionary, keeping the snippet in place if the keyword is unchanged
+                if new_keyword != keyword:
+                    self.snippets_data.pop(keyword, None)
+                self.snippets_data[new_keyword] = new_snippet_entry
+
+                # Update the keyword matcher with the new keyword
+                self.keyword_matcher.remove(keyword)
+                self.keyword_matcher.add(new_keyword)
+
+                # Update the search index
+                self.search_index.remove(keyword)
+                self.search_index.add(new_keyword, new_snippet_entry)
+
+                # Update the TreeView with the new keyword and text
+                self.sort_cache.clear()
+                self.tree_order[self.tree_order.index(keyword)] = new_keyword
+                self.selected_keyword = new_keyword
+                self.filter_tree()
+
+                # Update the text_display with the new keyword and text, unless the search now hides the snippet
+                if self.selected_keyword == new_keyword:
+                    self.text_display.config(state='normal')  # Enable editing temporarily
+                    self.text_display.delete(1.0, tk.END)
+                    self.text_display.insert(tk.END, f"{new_text}")
+                    self.text_display.config(state='disabled')  # Disable editing again
+
+                # Update the XML file (if needed)
+                self.update_snippet_in_xml(keyword, new_keyword, new_snippet_entry)
+               
+    def remove_snippet(self):
+        """
+        Remove the selected snippet from the TreeView.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        keyword = self.selected_keyword
+
+        if keyword is not None:
+            # Remove the snippet from the snippets_data dictonary
+            self.snippets_data.pop(keyword, None)
+
+            # Remove the keyword from the keyword matcher
+            self.keyword_matcher.remove(keyword)
+
+            # Remove the snippet from the search index
+            self.search_index.remove(keyword)
+
+            # Remove the snippet from the TreeView
+            self.sort_cache.clear()
+            self.tree_order.remove(keyword)
+            self.selected_keyword = None
+            self.filter_tree()
+
+            # Remove the snippet from the XML file
+            self.remove_snippet_from_xml(keyword)
+
+    def show_save_error(self, error):
+        """
+        Tell the user that snippet edits could not be saved to the XML file. Runs on the Tk thread.
+
+        Parameters:
+        - error: The error message.
+
+        Returns:
+        None
+        """
+        tk.messagebox.showinfo("Save Failed", f"The snippets could not be saved to {xml_file}: {error}\n\nYour edits will be saved again with the next one, or when Notator Assistant is closed.")
+
+    def save_snippet_to_xml(self, keyword, snippet_entry):
+        """
+        Save a new snippet to the XML file in the background.
+
+        Parameters:
+        - keyword: The keyword of the snippet.
+        - snippet_entry: a Snippet containing the category, subcategory, reason, and text of the snippet.
+
+        Returns:
+        None
+        """
+        self.snippet_writer.add(keyword, snippet_entry)
+
+    def update_snippet_in_xml(self, old_keyword, new_keyword, new_snippet_entry):
+        """
+        Update an existing snippet in the XML file in the background.
+
+        Parameters:
+        - old_keyword: The old keyword of the snippet to be updated.
+        - new_keyword: The new keyword for the updated snippet.
+        - new_snippet_entry: a Snippet containing the new category, subcategory, reason, and text of the snippet.
+
+        Returns:
+        None
+        """
+        self.snippet_writer.update(old_keyword, new_keyword, new_snippet_entry)
+
+    def remove_snippet_from_xml(self, keyword):
+        """
+        Remove a snippet from the XML file in the background.
+
+        Parameters:
+        - keyword: The keyword of the snippet to be removed.
+
+        Returns:
+        None
+        """
+        self.snippet_writer.remove(keyword)
+
+    def sort_treeview(self, col, reverse):
+        """
+        Sort the Treeview when a column header is clicked.
+
+        Parameters:
+        - col: The column to sort by.
+        - reverse: True to sort in reverse order, False otherwise.
+
+        Returns:
+        None
+        """
+        sorted_keywords = self.sort_cache.get((col, reverse))
+
+        if sorted_keywords is None:
+            opposite_keywords = self.sort_cache.get((col, not reverse))
+            if opposite_keywords is not None:
+                # Sort keys are unique, so the opposite order is the cached order reversed
+                sorted_keywords = opposite_keywords[::-1]
+            elif col == 'Keyword':
+                sorted_keywords = sorted(self.snippets_data, reverse=reverse)
+            else:
+                sorted_keywords = sorted(self.snippets_data, key=lambda keyword: (self.snippets_data[keyword].first_line, keyword), reverse=reverse)
+            self.sort_cache[(col, reverse)] = sorted_keywords
+
+        # Show the sorted rows matching the search in one render of the visible rows
+        self.tree_order = list(sorted_keywords)
+        self.filter_tree()
+
+        # Switch the sort order for the next click
+        self.tree.heading(col, command=lambda: self.sort_treeview(col, not reverse))
+
+    def on_tree_click(self, event):
+        """
+        Update the Text widget with the full text of the selected item in the TreeView.
+
+        Parameters:
+        - event: The mouse event object.
+
+        Returns:
+        None
+        """
+        keyword = self.selected_keyword
+        if keyword is not None:
+            try:
+                fulltext = self.snippets_data[keyword].text
+            except SnippetFileChangedError as e:
+                tk.messagebox.showinfo("Snippets Changed", str(e))
+                return
+            self.text_display.config(state='normal')  # Enable editing temporarily
+            self.text_display.delete(1.0, tk.END)
+            self.text_display.insert(tk.END, f"{fulltext}")
+            self.text_display.config(state='disabled')  # Disable editing again
+
+    def on_search_change(self, *args):
+        """
+        Schedule filtering the Treeview once typing in the search box pauses.
+
+        Parameters:
+        - *args: Variable number of arguments passed by the variable trace.
+
+        Returns:
+        None
+        """
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DELAY_MS, self.apply_search)
 
-                # Update the XML file (if needed)
-                self.update_snippet_in_xml(keyword, new_keyword, new_category, new_subcategory, new_reason, new_text)
-               
-    def remove_snippet(self):
+    def apply_search(self):
         """
-        Remove the selected snippet from the TreeView.
+        Filter the Treeview by the search box and scroll back to the top.
 
         Parameters:
         None
@@ -576,192 +4055,265 @@ class NotatorAssistant:
         Returns:
         None
         """
-        selected_item = self.tree.selection()
+        self.search_after_id = None
+        self.tree_top = 0
+        self.filter_tree()
 
-        if selected_item:
-            keyword, _ = self.tree.item(selected_item)['values']
+    def filter_tree(self):
+        """
+        Set the rows of the Treeview to the snippets matching the search box, in display order, and render them.
 
-            # Remove the snippet from the snippets_data dictonary
-            snippets_data.pop(keyword, None)
+        Parameters:
+        None
 
-            # Remove the snippet from the TreeView
-            self.tree.delete(selected_item)
+        Returns:
+        None
+        """
+        query = self.search_var.get().strip()
+        if query:
+            matches = self.search_index.search(query)
+            self.tree_keywords = [keyword for keyword in self.tree_order if keyword in matches]
+            if self.search_index.ready.is_set():
+                self.search_count_label.config(text=f"{len(self.tree_keywords)} of {len(self.tree_order)}")
+            else:
+                self.search_count_label.config(text=f"{len(self.tree_keywords)} of {len(self.tree_order)} (indexing...)")
 
-            # Remove the snippet from the XML file
-            self.remove_snippet_from_xml(keyword)
+            # Drop a selection the search hides, so Edit Snippet and Remove Snippet only act on a row the user can see
+            if self.selected_keyword is not None and self.selected_keyword not in matches:
+                self.selected_keyword = None
+                self.text_display.config(state='normal')  # Enable editing temporarily
+                self.text_display.delete(1.0, tk.END)
+                self.text_display.config(state='disabled')  # Disable editing again
+        else:
+            self.tree_keywords = self.tree_order
+            self.search_count_label.config(text="")
+        self.render_tree()
 
-    def save_snippet_to_xml(self, keyword, snippet_entry):
+    def on_search_index_ready(self):
         """
-        Save a new snippet to the XML file.
+        Search again once the search index is ready, as the snippets were scanned without their full texts until
+        then. Runs on the Tk thread.
 
         Parameters:
-        - keyword: The keyword of the snippet.
-        - snippet_entry: a tuple containing the category, subcategory, reason, and text of the snippet.
+        None
 
         Returns:
         None
         """
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+        if self.search_var.get().strip():
+            self.filter_tree()
 
-        # Create a new 'snippet' element
-        new_snippet = ET.Element('snippet')
+    def render_tree(self):
+        """
+        Insert the visible rows of tree_keywords into the Treeview and update the scrollbar.
 
-        # Create 'keyword' and 'text' sub-elements
-        ET.SubElement(new_snippet, 'keyword').text = keyword
-        ET.SubElement(new_snippet, 'category').text = snippet_entry[0]
-        ET.SubElement(new_snippet, 'subcategory').text = snippet_entry[1]
-        ET.SubElement(new_snippet, 'reason').text = snippet_entry[2]
-        ET.SubElement(new_snippet, 'text').text = snippet_entry[3]
-        
+        Parameters:
+        None
 
+        Returns:
+        None
+        """
+        # Keep the first visible row in range
+        row_count = len(self.tree_keywords)
+        self.tree_top = max(0, min(self.tree_top, row_count - TREE_ROWS))
+        visible_keywords = self.tree_keywords[self.tree_top:self.tree_top + TREE_ROWS]
+
+        # Replace the rows in the Treeview, using the keywords as item ids
+        self.tree.delete(*self.tree.get_children())
+        for keyword in visible_keywords:
+            # Display only the first line of multiline text
+            self.tree.insert('', 'end', iid=keyword, values=(keyword, self.snippets_data[keyword].first_line))
 
-        # Append the new snippet to the root
-        root.append(new_snippet)
+        if self.selected_keyword in visible_keywords:
+            self.tree.selection_set(self.selected_keyword)
+            self.tree.focus(self.selected_keyword)
 
-        # Convert the XML tree to a formatted string with newline and indents
-        xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="    ")
+        if row_count:
+            self.tree_scrollbar.set(self.tree_top / row_count, (self.tree_top + len(visible_keywords)) / row_count)
+        else:
+            self.tree_scrollbar.set(0, 1)
 
-        # Remove empty lines
-        xml_str = '\n'.join([line for line in xml_str.split('\n') if line.strip()])
+    def scroll_tree_to(self, keyword):
+        """
+        Scroll the Treeview so the row of a keyword is visible.
 
-        # Write the formatted XML string to the XML file
-        with open(xml_file, 'w') as file:
-            file.write(xml_str)
+        Parameters:
+        - keyword: The keyword of the row.
 
-    def update_snippet_in_xml(self, old_keyword, new_keyword, new_category, new_subcategory, new_reason, new_text):
+        Returns:
+        None
+        """
+        index = self.tree_keywords.index(keyword)
+        if index < self.tree_top:
+            self.tree_top = index
+        elif index >= self.tree_top + TREE_ROWS:
+            self.tree_top = index - TREE_ROWS + 1
+        self.render_tree()
+
+    def on_tree_select(self, event):
         """
-        Update an existing snippet in the XML file.
+        Remember the keyword of the row selected in the TreeView.
 
         Parameters:
-        - old_keyword: The old keyword of the snippet to be updated.
-        - new_keyword: The new keyword for the updated snippet.
-        - new_category: The new category for the updated snippet.
-        - new_subcategory: The new subcategory for the updated snippet.
-        - new_reason: The new reason for the updated snippet.
-        - new_text: The new text content for the updated snippet.
+        - event: The selection event object.
 
         Returns:
         None
         """
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        for snippet in root.findall('snippet'):
-            if snippet.find('keyword').text == old_keyword:
-                # Update the keyword and text of the snippet
-                snippet.find('keyword').text = new_keyword
-                snippet.find('category').text = new_category
-                snippet.find('subcategory').text = new_subcategory
-                snippet.find('reason').text = new_reason
-                snippet.find('text').text = new_text
-                break
+        selected_item = self.tree.selection()
+        if selected_item:
+            self.selected_keyword = selected_item[0]  # Rows scrolling out of view leave the selection as it was
 
-        # Convert the XML tree to a formatted string with newline and indents
-        xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="    ")
+    def on_tree_mousewheel(self, event):
+        """
+        Scroll the TreeView with the mouse wheel.
 
-        # Remove empty lines
-        xml_str = '\n'.join([line for line in xml_str.split('\n') if line.strip()])
+        Parameters:
+        - event: The mouse wheel event object.
 
-        # Write the formatted XML string to the XML file
-        with open(xml_file, 'w') as file:
-            file.write(xml_str)
+        Returns:
+        "break" to prevent the default scrolling of the Treeview.
+        """
+        if event.num == 4 or event.delta > 0:
+            self.tree_yview('scroll', -3, 'units')
+        else:
+            self.tree_yview('scroll', 3, 'units')
+        return "break"
 
-    def remove_snippet_from_xml(self, keyword):
+    def on_tree_key(self, event):
         """
-        Remove a snippet from the XML file.
+        Move the selection of the TreeView with the arrow and page keys, scrolling as needed.
 
         Parameters:
-        - keyword: The keyword of the snippet to be removed.
+        - event: The key press event object.
 
         Returns:
-        None
+        "break" to prevent the default handling of the key by the Treeview.
         """
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+        if not self.tree_keywords:
+            return "break"
 
-        for snippet in root.findall('snippet'):
-            if snippet.find('keyword').text == keyword:
-                root.remove(snippet)
-                break
+        step = {'Up': -1, 'Down': 1, 'Prior': -TREE_ROWS, 'Next': TREE_ROWS}[event.keysym]
+        try:
+            index = self.tree_keywords.index(self.selected_keyword) + step
+        except ValueError:
+            index = self.tree_top  # Nothing is selected, start from the first visible row
+        index = max(0, min(index, len(self.tree_keywords) - 1))
+
+        self.selected_keyword = self.tree_keywords[index]
+        self.scroll_tree_to(self.selected_keyword)
+        self.on_tree_click(event)
+        return "break"
 
-        # Convert the XML tree to a formatted string with newline and indents
-        xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="    ")
+    def tree_yview(self, *args):
+        """
+        Callback for the scrollbar of the Treeview, scrolling through tree_keywords.
 
-        # Remove empty lines
-        xml_str = '\n'.join([line for line in xml_str.split('\n') if line.strip()])
+        Parameters:
+        - *args: Variable number of arguments passed to the callback, ('moveto', fraction) or ('scroll', number, what).
 
-        # Write the formatted XML string to the XML file
-        with open(xml_file, 'w') as file:
-            file.write(xml_str)
+        Returns:
+        None
+        """
+        if args[0] == 'moveto':
+            self.tree_top = round(float(args[1]) * len(self.tree_keywords))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= TREE_ROWS
+            self.tree_top += step
+        self.render_tree()
 
-    def sort_treeview(self, col, reverse):
+    def text_display_yview(self, *args):
         """
-        Sort the Treeview when a column header is clicked.
+        Callback for the embedded scrollbar in the Text widget.
 
         Parameters:
-        - col: The column to sort by.
-        - reverse: True to sort in reverse order, False otherwise.
+        - *args: Variable number of arguments passed to the callback.
 
         Returns:
         None
         """
-        data = [(self.tree.set(item, col), item) for item in self.tree.get_children('')]
-        data.sort(reverse=reverse)
-
-        for index, (val, item) in enumerate(data):
-            self.tree.move(item, '', index)
-
-        # Switch the sort order for the next click
-        self.tree.heading(col, command=lambda: self.sort_treeview(col, not reverse))
+        self.text_display.yview(*args)
 
-    def on_tree_click(self, event):
+    def post_ui_event(self, handler, *args):
         """
-        Update the Text widget with the full text of the selected item in the TreeView.
+        Post an event to be handled on the Tk thread. Safe to call from any thread.
 
         Parameters:
-        - event: The mouse event object.
+        - handler: The function that handles the event.
+        - *args: The arguments to pass to the handler.
 
         Returns:
         None
         """
-        selected_item = self.tree.selection()
-        if selected_item:
-            keyword, text = self.tree.item(selected_item)['values']
-            snippet_entry = self.snippets_data.get(keyword, "")
-            fulltext = snippet_entry[3]
-            self.text_display.config(state='normal')  # Enable editing temporarily
-            self.text_display.delete(1.0, tk.END)
-            self.text_display.insert(tk.END, f"{fulltext}")
-            self.text_display.config(state='disabled')  # Disable editing again
+        self.ui_events.put((time.perf_counter(), handler, args))
 
-    def tree_yview(self, *args):
+    def drain_ui_events(self):
         """
-        Callback for the embedded scrollbar in the Treeview.
+        Handle the events posted from other threads, then schedule the next drain. Runs on the Tk thread.
+
+        The next drain comes quickly while events keep being posted, and backs off to UI_EVENT_IDLE_POLL_MS while
+        none are, so an idle window is not woken up 200 times a second.
 
         Parameters:
-        - *args: Variable number of arguments passed to the callback.
+        None
 
         Returns:
         None
         """
-        self.tree.yview(*args)
+        if self.handle_ui_events():
+            self.ui_event_poll_ms = UI_EVENT_POLL_MS
+        else:
+            self.ui_event_poll_ms = min(self.ui_event_poll_ms * 2, UI_EVENT_IDLE_POLL_MS)  # Back off while idle
+        self.root.after(self.ui_event_poll_ms, self.drain_ui_events)
 
-    def text_display_yview(self, *args):
+    def handle_ui_events(self):
         """
-        Callback for the embedded scrollbar in the Text widget.
+        Handle the events posted from other threads so far. Runs on the Tk thread.
 
         Parameters:
-        - *args: Variable number of arguments passed to the callback.
+        None
 
         Returns:
+        - handled: The number of events handled.
+        """
+        handled = 0
+        while True:
+            try:
+                posted_time, handler, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                return handled
+            handled += 1
+
+            # Measure how long the event waited between being posted and being handled
+            latency = time.perf_counter() - posted_time
+            self.ui_event_count += 1
+            self.total_ui_event_latency += latency
+            self.max_ui_event_latency = max(self.max_ui_event_latency, latency)
+            DIAGNOSTICS.record('ui_event_latency', latency)
+
+            try:
+                handler(*args)
+            except Exception as e:
+                print(f"Error while handling event: {e}")
+
+    def ui_event_stats(self):
+        """
+        Get the statistics of the events posted from other threads.
+
+        Parameters:
         None
+
+        Returns:
+        - stats: A dictionary with the number of events handled and the mean and max hook-to-handle latency in milliseconds.
         """
-        self.text_display.yview(*args)
+        mean_latency = self.total_ui_event_latency / self.ui_event_count if self.ui_event_count else 0.0
+        return {'handled': self.ui_event_count, 'mean_latency_ms': mean_latency * 1000, 'max_latency_ms': self.max_ui_event_latency * 1000}
 
     def on_mouse_click(self):
         """
-        Handle left mouse button click event.
+        Handle left mouse button click event. Runs on the mouse hook thread.
 
         Parameters:
         None
@@ -770,153 +4322,170 @@ class NotatorAssistant:
         None
         """
         # Reset the current word when the left mouse button is clicked
-        self.reset_current_word()
+        if self.settings_data.reset_on_click:
+            self.post_ui_event(self.reset_current_word)
 
     def on_key_press(self, event):
         """
-        Handle key press events.
+        Handle key press events. Runs on the keyboard hook thread, and only posts the key to the Tk thread.
 
         Parameters:
         - event: The keyboard event object.
 
+        Returns:
+        None
+        """
+        # The state of the modifiers is only known at the time of the key press
+        if event.name == '`':
+            key = (event.name, self.backend.is_pressed('alt'), self.backend.is_pressed('ctrl'), time.perf_counter())
+        else:
+            key = (event.name, False, False, time.perf_counter())
+
+        # Keys received while an expansion is being written are held until it is done, as some are its own
+        if not self.expansion_worker.hold_key(key):
+            self.post_ui_event(self.handle_key_press, *key)
+
+    def handle_key_press(self, name, alt_pressed, ctrl_pressed, pressed_time=None):
+        """
+        Handle a key press posted by the keyboard hook. Runs on the Tk thread.
+
+        Parameters:
+        - name: The name of the pressed key.
+        - alt_pressed: True if alt was held down when the key was pressed, False otherwise.
+        - ctrl_pressed: True if ctrl was held down when the key was pressed, False otherwise.
+        - pressed_time: (optional) The time.perf_counter() at which the hook received the key.
+
         Returns:
         None
         """
         if self.current_word is None:
             self.reset_current_word()
         
-        if event.name == 'space':
+        if name == 'space':
             # check for matching keyword and expand text snippet
-            for keyword, snippet_entry in self.snippets_data.items():
-                category, subcategory, reason, text = snippet_entry
-                if (self.settings_data.get('Settings', 'keyword_case_sensitive') == "False"):
-                    keyword = keyword.lower()
-                    self.current_word = self.current_word.lower()
-                if keyword == self.current_word:
-                    # remove characters equal to the length of the keyword from the current word plus one for the space
-                    for _ in range(len(keyword) + 1):
-                        keyboard.press('backspace')
-                        keyboard.release('backspace')
-                        self.root.after(10)
-                       
-                    # write the expanded text
-                    keyboard.write(text)
-
-                    # set the category, subcategory, reason
-                    if category is not None:
-                        self.current_category = category
-                        if subcategory is not None:
-                            self.current_subcategory = subcategory
-                            if reason is not None:
-                                self.current_reason = reason
+            keyword = self.keyword_matcher.match()
+            if pressed_time is not None:
+                DIAGNOSTICS.record('hook_to_match', time.perf_counter() - pressed_time)
+            if keyword is not None:
+                snippet_entry = self.snippets_data[keyword]
+
+                # hand the expansion to the expansion worker, which removes characters equal to the length of the keyword
+                # plus one for the space and writes the expanded text with the selected expansion method
+                injector = self.text_injectors[self.settings_data.injection_backend]
+                self.expansion_worker.submit(injector, len(keyword) + 1, snippet_entry)
+
+                # set the category, subcategory, reason
+                if snippet_entry.category:
+                    self.current_category = snippet_entry.category
+                    if snippet_entry.subcategory:
+                        self.current_subcategory = snippet_entry.subcategory
+                        if snippet_entry.reason:
+                            self.current_reason = snippet_entry.reason
 
             self.reset_current_word()  # Reset the current word
             self.reset_timeout_timer()  # Reset the timeout timer when space is pressed
            
-        elif event.name == 'enter':
+        elif name == 'enter':
             self.reset_current_word()  # Reset the current word on pressing Enter
             self.reset_timeout_timer()  # Reset the timeout timer when Enter is pressed
 
-        elif event.name == 'tab':
-            if (self.settings_data.get('Settings', 'reset_on_tab') == "True"):
+        elif name == 'tab':
+            if self.settings_data.reset_on_tab:
                 self.reset_current_word()
        
-        elif event.name == 'backspace':
-            if (self.settings_data.get('Settings', 'reset_on_backspace') == "True"):
+        elif name == 'backspace':
+            if self.settings_data.reset_on_backspace:
                 self.reset_current_word()
             else:
                 self.current_word = self.current_word[:-1]  # Remove the last character when backspace is pressed
+                self.keyword_matcher.backspace()  # Step the keyword matcher back by one character
                 self.reset_timeout_timer()  # Reset the timeout timer when backspace is pressed
 
-        elif event.name == '`' and keyboard.is_pressed('alt'):
+        elif name == '`' and alt_pressed:
             self.auto_close_issues()
 
-        elif event.name == '`' and keyboard.is_pressed('ctrl'):
+        elif name == '`' and ctrl_pressed:
             self.auto_fill_categories() 
    
-        elif event.name in string.printable:
-            self.current_word += event.name  # Add the pressed key to the current word
+        elif name in string.printable:
+            self.current_word += name  # Add the pressed key to the current word
+            self.keyword_matcher.feed(name)  # Advance the keyword matcher by the pressed key
             self.reset_timeout_timer()  # Reset the timeout timer when a printable character is pressed
 
-    def image_exists(self, image_path, conf):
+    def auto_close_issues(self):
         """
-        Check if an image appears on screen.
+        Using PyAutoGUI, close all open issues in the background, unless they are already being closed.
 
         Parameters:
-        - image_path: The path to the image.
-        - conf: The accuracy level of locating the image.
+        None
 
         Returns:
-        - True: If the image is found on screen
-        - False: If the image is not found on screen
+        None
         """
-        image_location = None
-        try:
-            image_location = pyautogui.locateOnScreen(image_path, confidence=conf)
-        except Exception as e:
-            print ("Error while processing image:", str(e))
+        if self.auto_close_job is not None and self.auto_close_job.running():
+            return
+        if self.auto_fill_thread is not None and self.auto_fill_thread.is_alive():
+            return  # Do not click into the page while the categories are being filled in
+
+        self.auto_close_job = AutoCloseJob(
+            self.template_matcher, self.template_bank, self.settings_data.click_interval,
+            lambda job: self.post_ui_event(self.show_auto_close_progress, job.state, job.issues_closed),
+            lambda job: self.post_ui_event(self.show_auto_close_summary, job.summary())
+        )
+
+        self.job_label.config(text="")
+        self.job_button.config(text="Cancel", command=self.cancel_auto_close)
+        self.job_frame.pack(side="top", fill="both", after=self.frame1)
+        self.job_progressbar.start()
+        self.close_button.config(state='disabled')
+        self.auto_close_job.start()
+
+    def cancel_auto_close(self):
+        """
+        Cancel the auto close job before its next click.
 
-        if (image_location is not None):
-            return True
-        else:
-            return False 
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        if self.auto_close_job is not None:
+            self.auto_close_job.cancel()
+            self.job_label.config(text="Cancelling...")
 
-    def click_image(self, image_path, conf):
+    def show_auto_close_progress(self, state, issues_closed):
         """
-        Click on an image that is currently on screen.
+        Show the step the auto close job is performing.
 
         Parameters:
-        - image_path: The path to the image.
-        - conf: The accuracy level of locating the image.
+        - state: The state of the job.
+        - issues_closed: The number of issues closed so far.
 
         Returns:
-        - True: If the image is clicked
-        - False: If the image is not clicked
+        None
         """
-        image_location = None
-        try: 
-            image_location = pyautogui.locateOnScreen(image_path, confidence=conf)
-        except Exception as e:
-            print("Error while processing image:", str(e))
-            
-        if (image_location is not None):
-            image_center = pyautogui.center(image_location)
-            pyautogui.click(image_center[0], image_center[1])
-            return True
-        else:
-            return False
+        if not self.auto_close_job.cancelled.is_set():
+            self.job_label.config(text=f"{issues_closed} closed, {state}...")
 
-    def auto_close_issues(self):
+    def show_auto_close_summary(self, summary):
         """
-        Using PyAutoGUI, close all open issues
+        Show the summary of the finished auto close job until it is dismissed.
 
         Parameters:
-        None
+        - summary: The summary of the job.
 
         Returns:
         None
         """
-        if (self.image_exists('img/issue.png', 0.99)):
-            self.click_image('img/issue.png', 0.99)
-            self.click_image('img/first.png', 0.99)
-            self.click_image('img/tab_menu.png', 0.99)
-            self.click_image('img/close_issue.png', 0.99)
-        elif (self.click_image('img/issue_selected.png', 0.99)):
-            self.click_image('img/first.png', 0.99)
-            self.click_image('img/tab_menu.png', 0.99)
-            self.click_image('img/close_issue.png', 0.99)
-        
-        while (self.image_exists('img/next.png', 0.99)):
-            self.click_image('img/next.png', 0.99)
-            self.click_image('img/tab_menu.png', 0.99)
-            self.click_image('img/close_issue.png', 0.99)
-            self.click_image('img/yes.png', 0.99)
-
-        self.click_image('img/case_overview.png', 0.99)
+        self.job_progressbar.stop()
+        self.job_label.config(text=summary)
+        self.job_button.config(text="Dismiss", command=self.job_frame.pack_forget)
+        self.close_button.config(state='normal')
 
     def auto_fill_categories(self):
         """
-        Using PyAutoGUI, fill in case categories
+        Using PyAutoGUI, fill in case categories in the background, unless they are already being filled in.
 
         Parameters:
         None
@@ -924,16 +4493,43 @@ class NotatorAssistant:
         Returns:
         None
         """
-        if (self.image_exists('img/case_overview.png', 0.99)):
-            self.click_image('img/case_overview.png', 0.99)
-        if (self.image_exists('img/category_text_entry.png', 0.9)):
-            self.click_image('img/category_text_entry.png', 0.9)
-            pyautogui.write(self.current_category)
-            pyautogui.press('tab')
-            pyautogui.write(self.current_subcategory)
-            pyautogui.press('tab')
-            pyautogui.write(self.current_reason)
-            pyautogui.press('tab')
+        if self.auto_close_job is not None and self.auto_close_job.running():
+            return  # Do not click into the page while issues are being closed
+        if self.auto_fill_thread is not None and self.auto_fill_thread.is_alive():
+            return
+
+        # The values are taken now, as typing goes on changing them while the fields are searched for
+        values = (self.current_category, self.current_subcategory, self.current_reason)
+        self.auto_fill_thread = threading.Thread(target=self.fill_categories, args=(values, self.settings_data.click_interval), name="AutoFill", daemon=True)
+        self.auto_fill_thread.start()
+
+    def fill_categories(self, values, timeout):
+        """
+        Click into the case categories and type the values in. Runs on the auto fill thread, so searching the
+        screen and waiting for the fields does not hold up the window.
+
+        Parameters:
+        - values: The category, subcategory and reason to type.
+        - timeout: The number of seconds to wait for the category fields after clicking the case overview.
+
+        Returns:
+        None
+        """
+        matcher = self.template_matcher
+        images = self.template_bank
+
+        try:
+            found = matcher.locate_all({images['case_overview']: 0.99, images['category_text_entry']: 0.9})
+            if (matcher.click(found[images['case_overview']])):
+                # The case overview may move or reveal the category fields, so wait for them
+                found[images['category_text_entry']] = matcher.wait_for(images['category_text_entry'], 0.9, timeout)
+            if (matcher.click(found[images['category_text_entry']])):
+                for value in values:
+                    self.backend.write(value)
+                    self.backend.send('tab')
+                    self.backend.sleep(AUTOMATION_INPUT_PAUSE)
+        except Exception as e:
+            print(f"Error while filling in categories: {e}")
 
     def clear_modifiers(self):
         """
@@ -945,16 +4541,16 @@ class NotatorAssistant:
         Returns:
         None
         """
-        keyboard.release('alt')
+        self.backend.release('alt')
         self.root.after(10)
-        keyboard.release('ctrl')
+        self.backend.release('ctrl')
         self.root.after(10)
-        keyboard.release('shift')
+        self.backend.release('shift')
         self.root.after(10)
 
     def on_window_close(self):
         """
-        Removes all keyboard and mouse hooks when the window is closed.
+        Saves pending snippet edits and removes all keyboard and mouse hooks when the window is closed.
 
         Parameters:
         None
@@ -962,76 +4558,466 @@ class NotatorAssistant:
         Returns:
         None
         """
+        # Stop the auto close job before saving what it has found, as its thread adds to the locations
+        if self.auto_close_job is not None:
+            self.auto_close_job.cancel()
+            self.auto_close_job.thread.join()
+        if self.auto_fill_thread is not None:
+            self.auto_fill_thread.join()
+
+        save_error = self.stop_engine()
+        if save_error is not None:
+            # The writer's own error dialog is posted to the event queue, which is no longer handled
+            tk.messagebox.showinfo("Save Failed", f"The snippets could not be saved to {xml_file}: {save_error}\n\nYour latest edits were not saved.")
+
+        # Refresh the snapshot cache if snippet edits have invalidated it, but only once they are in the XML file,
+        # as the cache is keyed to the file as it is now
+        if save_error is None and not os.path.exists(snippets_cache_path(xml_file)):
+            write_snippets_cache_in_background(xml_file, self.snippets_data, self.keyword_matcher.case_sensitive)
+
+        # Remember where the automation images were found for the next session
+        if self.template_matcher.locations_changed:
+            write_template_locations(locations_file, self.template_matcher.locations)
+
         self.clear_modifiers()
-        keyboard.unhook_all()
-        mouse.unhook_all()
         self.root.destroy()
 
-def read_snippets_from_xml(xml_file):
+def read_snippets_from_xml(xml_file, lazy_text=False):
     """
     Read snippets from an XML file and return a dictionary of keywords and snippet entries.
 
+    The file is streamed so only one snippet element is held in memory at a time.
+
     Parameters:
     - xml_file: The path to the XML file containing snippets.
+    - lazy_text: (optional) True to leave large texts in the XML file and load them when needed.
 
     Returns:
     - snippets_data: A dictionary containing keywords as keys and corresponding text snippets as values.
                      Returns an empty dictionary if there's an error reading the XML file.
     """
     try:
+        if lazy_text:
+            return read_snippets_with_lazy_text(xml_file)
+
         snippets_data = {}  # Initialize an empty dictionary to store snippets
-        tree = ET.parse(xml_file)  # Parse the XML file
-        root = tree.getroot()  # Get the root element of the XML tree
+        root = None
+
+        # Iterate through the XML as it is parsed, handling each 'snippet' element once it is complete
+        for event, element in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element  # Keep the root element so processed snippets can be cleared from it
+                continue
 
-        # Iterate through each 'snippet' element in the XML
-        for element in root.findall('snippet'):
-            keyword = element.find('keyword').text  # Extract the keyword from the 'keyword' sub-element
-            category = element.find('category').text # Extract the text content from the 'category' sub-element
-            subcategory = element.find('subcategory').text # Extract the text content from the 'subcategory' sub-element
-            reason = element.find('reason').text # Extract the text content from the 'reason' sub-element
-            text = element.find('text').text  # Extract the text content from the 'text' sub-element
+            if element.tag == 'snippet':
+                keyword = element.findtext('keyword')  # Extract the keyword from the 'keyword' sub-element
+                category = element.findtext('category') # Extract the text content from the 'category' sub-element
+                subcategory = element.findtext('subcategory') # Extract the text content from the 'subcategory' sub-element
+                reason = element.findtext('reason') # Extract the text content from the 'reason' sub-element
+                text = element.findtext('text')  # Extract the text content from the 'text' sub-element
 
-            # Create a tuple containing category, subcategory, reason, and text
-            snippet_entry = (category, subcategory, reason, text) 
+                # Create a Snippet containing category, subcategory, reason, and text
+                snippet_entry = Snippet(category, subcategory, reason, text)
 
-            # Add the snippet_info tuple to the dictionary with keyword as key
-            snippets_data[keyword] = snippet_entry
+                # Add the Snippet to the dictionary with keyword as key
+                snippets_data[keyword] = snippet_entry
+
+                # Free the parsed snippet
+                root.clear()
 
         return snippets_data  # Return the dictionary of snippets
-    except (FileNotFoundError, ET.ParseError) as e:
+    except (FileNotFoundError, ET.ParseError, expat.ExpatError) as e:
         # Handle file not found or parsing errors
         print(f"Error reading XML file: {e}")
         return {}  # Return an empty dictionary if there's an error
+
+def read_snippets_with_lazy_text(xml_file):
+    """
+    Read snippets from an XML file, leaving texts of at least LAZY_TEXT_MIN_LENGTH characters in the file.
+
+    ElementTree does not report where elements are in the file, so this uses the expat parser it is built on,
+    which does.
+
+    Parameters:
+    - xml_file: The path to the XML file containing snippets.
+
+    Returns:
+    - snippets_data: A dictionary containing keywords as keys and snippet entries as values, with large
+                     texts replaced by LazyText objects.
+    """
+    snippets_data = {}
+    fields = {}  # Values of the snippet being parsed
+    current_tag = None  # The snippet field being parsed
+    chars = []  # Character data of the field being parsed
+    text_start = 0  # Byte offset of the opening tag of the field being parsed
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    def start_element(name, attributes):
+        nonlocal current_tag, chars, text_start
+        if name == 'snippet':
+            fields.clear()
+        elif name in ('keyword', 'category', 'subcategory', 'reason', 'text'):
+            current_tag = name
+            chars = []
+            text_start = parser.CurrentByteIndex
+
+    def character_data(data):
+        if current_tag is not None:
+            chars.append(data)
+
+    def end_element(name):
+        nonlocal current_tag
+        if name == current_tag:
+            value = ''.join(chars) or None
+            if name == 'text' and value is not None and len(value) >= LAZY_TEXT_MIN_LENGTH:
+                # Keep only the first line and where to find the rest
+                value = LazyText(xml_file, text_start, parser.CurrentByteIndex, value.partition('\n')[0], file_stat.st_size, file_stat.st_mtime_ns)
+            fields[name] = value
+            current_tag = None
+        elif name == 'snippet':
+            snippets_data[fields.get('keyword')] = Snippet(fields.get('category'), fields.get('subcategory'), fields.get('reason'), fields.get('text'))
+
+    parser.StartElementHandler = start_element
+    parser.CharacterDataHandler = character_data
+    parser.EndElementHandler = end_element
+
+    with open(xml_file, 'rb') as file:
+        file_stat = os.fstat(file.fileno())  # Identifies the file the offsets are in
+        parser.ParseFile(file)
+
+    return snippets_data
    
+def write_snippets_to_xml(xml_file, snippets_data):
+    """
+    Write all snippets to an XML file.
+
+    The snippets are streamed to a temporary file next to the XML file, which then atomically
+    replaces it, so the XML file is never left half written.
+
+    Parameters:
+    - xml_file: The path to the XML file to write.
+    - snippets_data: A dictionary containing keywords as keys and snippet entries as values.
+
+    Returns:
+    - True: If the snippets were written
+    - False: If there was an error writing the snippets
+    """
+    directory = os.path.dirname(os.path.abspath(xml_file))
+    try:
+        fd, temp_file = tempfile.mkstemp(prefix='.snippets-', suffix='.tmp', dir=directory)
+    except OSError as e:
+        print(f"Error writing XML file: {e}")
+        return False
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write('<?xml version="1.0" ?>\n<snippets>\n')
+            for keyword, snippet_entry in snippets_data.items():
+                file.write('    <snippet>\n')
+                # Texts left in the old file are loaded here, and stay loaded once the file is replaced
+                values = (keyword, snippet_entry.category, snippet_entry.subcategory, snippet_entry.reason, snippet_entry.text)
+                for tag, value in zip(('keyword', 'category', 'subcategory', 'reason', 'text'), values):
+                    if value:
+                        file.write(f'        <{tag}>{escape(value)}</{tag}>\n')
+                    else:
+                        file.write(f'        <{tag}/>\n')
+                file.write('    </snippet>\n')
+            file.write('</snippets>')
+
+            # Make sure the data is on disk before it replaces the XML file
+            file.flush()
+            os.fsync(file.fileno())
+
+        # The temporary file is only readable by its owner; keep the permissions of the file it replaces
+        if os.path.exists(xml_file):
+            shutil.copymode(xml_file, temp_file)
+
+        # On Windows the XML file cannot be replaced while it is open, as it briefly is while the search index reads it
+        for attempt in range(SNIPPETS_REPLACE_ATTEMPTS):
+            try:
+                os.replace(temp_file, xml_file)
+                break
+            except PermissionError:
+                if attempt == SNIPPETS_REPLACE_ATTEMPTS - 1:
+                    raise
+                time.sleep(SNIPPETS_REPLACE_RETRY_DELAY)
+    except OSError as e:
+        # Handle errors writing or replacing the file
+        print(f"Error writing XML file: {e}")
+        return False
+    finally:
+        # Whatever went wrong, including errors reading texts left in the old file, leave no temporary file behind
+        if os.path.exists(temp_file):
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+    remove_snippets_cache(xml_file)  # The snapshot cache no longer matches the XML file
+    return True
+
+def snippets_cache_path(xml_file):
+    """
+    Get the path of the snapshot cache of an XML file.
+
+    The cache is a pickle, and loading a pickle can run code, so it is kept in the user's own cache directory
+    rather than next to a snippet library that other users may be able to write to.
+
+    Parameters:
+    - xml_file: The path to the XML file containing snippets.
+
+    Returns:
+    - The path to the snapshot cache file, named after a hash of the XML file's absolute path.
+    """
+    name = hashlib.sha1(os.path.abspath(xml_file).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNIPPETS_CACHE_DIRECTORY, f"snippets-{name}.cache")
+
+def read_snippets_cache(xml_file):
+    """
+    Read the snippets and keyword index from the snapshot cache of an XML file.
+
+    The cache is only used if it was written for the XML file as it is now, going by its size and modification time.
+
+    Parameters:
+    - xml_file: The path to the XML file containing snippets.
+
+    Returns:
+    - (snippets_data, keyword_index): The cached snippets and KeywordIndex, or None if the cache is missing or stale.
+    """
+    try:
+        stat = os.stat(xml_file)
+        with open(snippets_cache_path(xml_file), 'rb') as file:
+            key, snippets_data, keyword_index = pickle.load(file)
+        if key != (SNIPPETS_CACHE_VERSION, stat.st_size, stat.st_mtime_ns):
+            return None  # The XML file has changed since the cache was written
+        return snippets_data, keyword_index
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError) as e:
+        # Handle unreadable or corrupt cache files
+        print(f"Error reading snippets cache: {e}")
+        return None
+
+def write_snippets_cache(xml_file, snippets_data, keyword_index, xml_stat=None):
+    """
+    Write the snippets and keyword index to the snapshot cache of an XML file.
+
+    Parameters:
+    - xml_file: The path to the XML file the snippets were read from.
+    - snippets_data: A dictionary containing keywords as keys and snippet entries as values.
+    - keyword_index: The KeywordIndex of the snippet keywords.
+    - xml_stat: (optional) The os.stat of the XML file when the snippets were read from it. Taken now if not given.
+
+    Returns:
+    None
+    """
+    cache_file = snippets_cache_path(xml_file)
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    try:
+        stat = xml_stat if xml_stat is not None else os.stat(xml_file)
+        key = (SNIPPETS_CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(prefix='.snippets-', suffix='.tmp', dir=directory)
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((key, snippets_data, keyword_index), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except (OSError, pickle.PicklingError) as e:
+        # Handle errors writing the cache, which is only an optimization
+        print(f"Error writing snippets cache: {e}")
+
+def write_snippets_cache_in_background(xml_file, snippets_data, case_sensitive):
+    """
+    Write the snapshot cache of an XML file on a background thread, from the snippets as they are now.
+
+    The thread works on a copy of the snippets and builds its own keyword index, so snippet edits made while it
+    runs are not written to the cache; the cache is keyed to the XML file as it is now, so it is not used once
+    those edits have been saved.
+
+    Parameters:
+    - xml_file: The path to the XML file the snippets were read from.
+    - snippets_data: A dictionary containing keywords as keys and snippet entries as values.
+    - case_sensitive: Whether the cached keyword index matches keywords with case sensitivity.
+
+    Returns:
+    None
+    """
+    try:
+        xml_stat = os.stat(xml_file)
+    except OSError as e:
+        print(f"Error writing snippets cache: {e}")
+        return
+    snippets_data = dict(snippets_data)
+    thread = threading.Thread(
+        target=lambda: write_snippets_cache(xml_file, snippets_data, KeywordIndex(snippets_data, case_sensitive), xml_stat),
+        name="SnippetsCache"
+    )
+    thread.start()  # Not a daemon thread, so closing the program right away does not cut the cache short
+
+def remove_snippets_cache(xml_file):
+    """
+    Remove the snapshot cache of an XML file.
+
+    Parameters:
+    - xml_file: The path to the XML file containing snippets.
+
+    Returns:
+    None
+    """
+    try:
+        os.remove(snippets_cache_path(xml_file))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error removing snippets cache: {e}")
+
 def read_settings_from_ini(ini_file):
     """
-    Read settings from an INI file and return a configparser object.
+    Read settings from an INI file and return a Settings object.
 
     Parameters:
     - ini_file: The path to the INI file containing settings.
 
     Returns:
-    - settings_data: A configparser.ConfigParser object containing the settings read from the INI file.
-                     Returns an empty ConfigParser object if there's an error reading the INI file.
+    - settings_data: A Settings object containing the settings read from the INI file.
+                     Returns the default settings if there's an error reading the INI file.
     """
     try:
         config = configparser.ConfigParser()  # Initialize a ConfigParser object
         config.read(ini_file)  # Read the settings from the INI file
 
-        return config  # Return the ConfigParser object containing the settings
-    except (FileNotFoundError, configparser.Error) as e:
-        # Handle file not found or parsing errors
+        return Settings.from_config(config)  # Return the validated settings
+    except (FileNotFoundError, configparser.Error, ValueError) as e:
+        # Handle file not found, parsing or validation errors
         print(f"Error reading INI file: {e}")
-        return configparser.ConfigParser()  # Return an empty ConfigParser object if there's an error
+        return Settings()  # Return the default settings if there's an error
+
+def load_automation():
+    """
+    Import the screen automation stack: mouse, Pillow, PyAutoGUI, PyScreeze and, if it is installed, OpenCV.
+
+    Only the first call imports the modules, so everything that uses them calls this first. Calls made on other
+    threads while the modules are being imported wait for them.
+
+    Parameters:
+    None
+
+    Returns:
+    - import_time: The seconds spent importing, or 0.0 if the modules were already imported.
+    """
+    global mouse, pyscreeze, pyautogui, Image, cv2, numpy
+    if pyscreeze is not None:
+        return 0.0
+    with automation_lock:
+        if pyscreeze is not None:
+            return 0.0
+        start_time = time.perf_counter()
+        import mouse
+        from PIL import Image
+
+        try:
+            # OpenCV is optional; with it, automation images are kept as the arrays it matches against
+            import cv2
+            import numpy
+        except ImportError:
+            cv2 = None
+
+        try:
+            import pyautogui
+            pyautogui.PAUSE = AUTOMATION_INPUT_PAUSE  # Clicks wait for what they bring up instead of a fixed pause
+            pyautogui.FAILSAFE = True
+        except Exception:
+            # PyAutoGUI cannot be imported without a display on Linux; screen capture and matching still work through
+            # PyScreeze, so the benchmarks can run headless
+            pyautogui = None
+
+        import pyscreeze  # Imported last, as the other threads take it being set to mean the stack is loaded
+        return time.perf_counter() - start_time
+
+def read_template_locations(locations_file):
+    """
+    Read the last on-screen locations of the automation images from an INI file.
+
+    Parameters:
+    - locations_file: The path to the INI file containing image locations.
+
+    Returns:
+    - locations: A dictionary mapping image paths to (left, top, width, height) boxes.
+                 Returns an empty dictionary if there's an error reading the INI file.
+    """
+    locations = {}
+    try:
+        config = configparser.ConfigParser()
+        config.optionxform = str  # Keep image paths as they are
+        config.read(locations_file)
+        if config.has_section('Locations'):
+            for image_path, value in config.items('Locations'):
+                left, top, width, height = (int(part) for part in value.split(','))
+                locations[image_path] = (left, top, width, height)
+    except (configparser.Error, ValueError) as e:
+        # Handle parsing errors, the locations are only an optimization
+        print(f"Error reading template locations: {e}")
+        return {}
+    return locations
+
+def write_template_locations(locations_file, locations):
+    """
+    Write the last on-screen locations of the automation images to an INI file.
+
+    Parameters:
+    - locations_file: The path to the INI file to write.
+    - locations: A dictionary mapping image paths to (left, top, width, height) boxes.
+
+    Returns:
+    None
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str  # Keep image paths as they are
+    config['Locations'] = {image_path: ','.join(str(int(part)) for part in box) for image_path, box in sorted(locations.items())}
+    try:
+        with open(locations_file, 'w') as configfile:
+            config.write(configfile)
+    except OSError as e:
+        print(f"Error writing template locations: {e}")
+
+def read_event_trace(trace_file):
+    """
+    Read a recorded event trace for the TraceReplayBackend.
+
+    The trace is a text file with one event per line: the name of a pressed key as the keyboard library reports
+    it (a, space, backspace, ...), or CLICK_EVENT for a left mouse click.
+
+    Parameters:
+    - trace_file: The path to the trace file.
+
+    Returns:
+    - trace: A list of key names and CLICK_EVENTs.
+    """
+    with open(trace_file, encoding='utf-8') as file:
+        return [line.rstrip('\n') for line in file if line.rstrip('\n')]
 
 if __name__ == "__main__":
     xml_file = "snippets.xml"
     ini_file = "settings.ini"
-
-    snippets_data = read_snippets_from_xml(xml_file)
+    locations_file = "template_locations.ini"
+
+    # Load the snippets from the snapshot cache if it is up to date, otherwise parse the XML file
+    snippets_cache = read_snippets_cache(xml_file)
+    if snippets_cache is not None:
+        snippets_data, keyword_index = snippets_cache
+    else:
+        # Leave large texts in the XML file when the snippet library is large
+        lazy_text = os.path.exists(xml_file) and os.path.getsize(xml_file) >= LAZY_TEXT_FILE_SIZE
+        snippets_data = read_snippets_from_xml(xml_file, lazy_text)
+        keyword_index = None
     settings_data = read_settings_from_ini(ini_file)
    
     root = tk.Tk()
     root.resizable(False, False)
-    app = NotatorAssistant(root, snippets_data, settings_data)
+    app = NotatorAssistant(root, snippets_data, settings_data, keyword_index)
+
+    # Write the snapshot cache for the next start if it was missing or stale, once the window is up
+    if snippets_cache is None and os.path.exists(xml_file):
+        root.after_idle(write_snippets_cache_in_background, xml_file, snippets_data, settings_data.keyword_case_sensitive)
+
     root.mainloop()
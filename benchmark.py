@@ -0,0 +1,426 @@
+"""
+Benchmarks for Notator Assistant.
+
+Times importing the program and its screen automation stack, generates synthetic snippet libraries in the
+snippets.xml format and times loading and saving them, replays a keystroke trace through the keyboard handler,
+times template matching against screenshots, and replays an auto close session. Everything runs headless
+through the TraceReplayBackend, so the results of two versions can be compared on the same machine:
+
+    python benchmark.py --sizes 1000,10000,100000 --json before.json
+    python benchmark.py --trace keys.txt --screenshots screenshots/ --session session/
+
+A keystroke trace is a text file with one key name per line, as reported by the keyboard library (a, space,
+backspace, enter, ...), see read_event_trace. Without --trace a trace is generated from the library. Screenshots
+are PNG files of the screens the automation images are searched in. A session is a directory of PNG screenshots
+of an auto close run, one taken after each click, in file name order. Without --screenshots or --session, a
+session is generated with its own automation images, see generate_session, and used instead.
+"""
+import os
+import sys
+import time
+import json
+import math
+import random
+import argparse
+import tempfile
+import subprocess
+
+import NotatorAssistant as app
+from NotatorAssistant import (DIAGNOSTICS, AutoCloseJob, KeywordMatcher, LatencyHistogram, NotatorAssistant,
+                              Settings, Snippet, TemplateBank, TemplateMatcher, TraceReplayBackend, read_event_trace,
+                              read_snippets_cache, read_snippets_from_xml, read_snippets_with_lazy_text,
+                              remove_snippets_cache, write_snippets_cache, write_snippets_to_xml)
+
+WORDS = ("patient", "reports", "plan", "follow", "up", "in", "two", "weeks", "denies", "pain", "issue", "resolved",
+         "call", "back", "if", "symptoms", "worsen", "reviewed", "medication", "list", "with", "member", "the", "and")
+SCREEN_SIZE = (1920, 1080)  # Size of the generated screenshots
+GENERATED_IMAGE_SIZE = (80, 60)  # Size of the generated automation images
+AUTOMATION_IMAGES = ('issue', 'issue_selected', 'first', 'tab_menu', 'close_issue', 'yes', 'next', 'case_overview', 'category_text_entry')  # Names of the automation images
+
+def generate_library(count, rng):
+    """
+    Generate a synthetic snippet library.
+
+    Parameters:
+    - count: The number of snippets.
+    - rng: The random.Random to generate them with.
+
+    Returns:
+    - snippets_data: A dictionary mapping keywords to Snippets.
+    """
+    snippets_data = {}
+    for index in range(count):
+        keyword = f"={rng.choice(('ra', 'pl', 'fu', 'cl'))}{index}"
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 120)))
+        if index % 10 == 0:
+            text += "\n" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(200, 800)))  # A few long plan texts
+        if index % 25 == 0:
+            text = "Seen on {date}. " + text
+        snippets_data[keyword] = Snippet(f"Category {index % 7}", f"Subcategory {index % 13}", f"Reason {index % 3}", text)
+    return snippets_data
+
+def generate_trace(keywords, rng, length):
+    """
+    Generate a keystroke trace that types words and keywords, each followed by a space.
+
+    Parameters:
+    - keywords: The keywords that can be typed.
+    - rng: The random.Random to generate the trace with.
+    - length: The approximate number of keystrokes.
+
+    Returns:
+    - trace: A list of key names.
+    """
+    trace = []
+    while len(trace) < length:
+        word = rng.choice(keywords) if rng.random() < 0.2 else rng.choice(WORDS)
+        trace.extend(word)
+        if rng.random() < 0.05:
+            trace.extend(('backspace', word[-1]))  # Correct a typo
+        trace.append('space')
+    return trace
+
+def generate_session(directory, issues, rng):
+    """
+    Generate automation images, a screenshot showing all of them, and the screenshots of an auto close session
+    that closes a number of issues, one shown after each click.
+
+    The session gets its own images, noise patterns named after the automation images, as the images in img/
+    are of one particular website and may be placeholders. Each session screen is a gradient with the image
+    the next step of the job clicks pasted at a random position. The last screen only shows the case overview,
+    so the job stops looking for a next issue and finishes.
+
+    Parameters:
+    - directory: The directory to write the images and screenshots to.
+    - issues: The number of issues in the session.
+    - rng: The random.Random to generate the images and place them with.
+
+    Returns:
+    - (images_dir, screenshots_dir, session_dir): The directories of the images, of the screenshot showing all
+      of them and of the session screenshots.
+    """
+    from PIL import Image
+
+    images_dir, screenshots_dir, session_dir = (os.path.join(directory, name) for name in ('img', 'screenshots', 'session'))
+    for path in (images_dir, screenshots_dir, session_dir):
+        os.makedirs(path)
+    background = Image.linear_gradient('L').resize(SCREEN_SIZE).convert('RGB')
+
+    images = {}
+    for name in AUTOMATION_IMAGES:
+        images[name] = Image.frombytes('L', GENERATED_IMAGE_SIZE, rng.randbytes(GENERATED_IMAGE_SIZE[0] * GENERATED_IMAGE_SIZE[1])).convert('RGB')
+        images[name].save(os.path.join(images_dir, f"{name}.png"))
+
+    # One screenshot with every image, each at a random position in its own cell of a grid
+    screen = background.copy()
+    columns = math.ceil(math.sqrt(len(images)))
+    cell_width, cell_height = SCREEN_SIZE[0] // columns, SCREEN_SIZE[1] // columns
+    for index, image in enumerate(images.values()):
+        row, column = divmod(index, columns)
+        screen.paste(image, (column * cell_width + rng.randrange(cell_width - image.width),
+                             row * cell_height + rng.randrange(cell_height - image.height)))
+    screen.save(os.path.join(screenshots_dir, "all-images.png"))
+
+    steps = ['issue', 'first', 'tab_menu', 'close_issue'] + ['next', 'tab_menu', 'close_issue', 'yes'] * (issues - 1) + ['case_overview']
+    for index, name in enumerate(steps):
+        screen = background.copy()
+        image = images[name]
+        screen.paste(image, (rng.randrange(SCREEN_SIZE[0] - image.width), rng.randrange(SCREEN_SIZE[1] - image.height)))
+        screen.save(os.path.join(session_dir, f"screen-{index:03}.png"))
+
+    return images_dir, screenshots_dir, session_dir
+
+def best_of(function, repeat):
+    """
+    Time a function, keeping the fastest run.
+
+    Parameters:
+    - function: The function to time.
+    - repeat: The number of runs.
+
+    Returns:
+    - seconds: The duration of the fastest run.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+STARTUP_SCRIPT = """
+import json, time
+start_time = time.perf_counter()
+import NotatorAssistant
+import_time = time.perf_counter() - start_time
+print(json.dumps({'import_ms': import_time * 1000, 'load_automation_ms': NotatorAssistant.load_automation() * 1000}))
+"""
+
+def bench_startup(repeat):
+    """
+    Time importing the program, which is done before the window is shown, and loading the screen automation
+    stack, which is done in the background once it is, each in a fresh interpreter.
+
+    Parameters:
+    - repeat: The number of interpreters to start, the fastest times are kept.
+
+    Returns:
+    - startup: A dictionary with the import_ms and load_automation_ms.
+    """
+    startup = {}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        for name, ms in json.loads(output.splitlines()[-1]).items():
+            startup[name] = min(ms, startup.get(name, ms))
+    return startup
+
+def bench_read(xml_file, snippets_data, repeat):
+    """
+    Time loading a snippet library.
+
+    Parameters:
+    - xml_file: The path to the XML file of the library.
+    - snippets_data: The library, for writing the snapshot cache.
+    - repeat: The number of runs to keep the fastest of.
+
+    Returns:
+    - results: A dictionary mapping each loading method to its duration in milliseconds.
+    """
+    results = {
+        'read_snippets_from_xml': best_of(lambda: read_snippets_from_xml(xml_file), repeat),
+        'read_snippets_with_lazy_text': best_of(lambda: read_snippets_with_lazy_text(xml_file), repeat),
+    }
+    write_snippets_cache(xml_file, snippets_data, KeywordMatcher(snippets_data, False).index)
+    results['read_snippets_cache'] = best_of(lambda: read_snippets_cache(xml_file), repeat)
+    remove_snippets_cache(xml_file)  # The cache is kept in the user's cache directory, not with the temporary library
+    return {name: seconds * 1000 for name, seconds in results.items()}
+
+def bench_writes(xml_file, snippets_data):
+    """
+    Time the three XML write methods of NotatorAssistant, each from the call until its edit is in the file.
+
+    Parameters:
+    - xml_file: The path to the XML file of the library, which is rewritten.
+    - snippets_data: The library.
+
+    Returns:
+    - results: A dictionary mapping each write method to its call and file write durations in milliseconds.
+    """
+    engine = NotatorAssistant.headless(dict(snippets_data), Settings(), xml_file, TraceReplayBackend())
+    snippet_entry = Snippet("Category", "Subcategory", "Reason", "Benchmark snippet text.")
+
+    writes = (
+        ('save_snippet_to_xml', lambda: engine.save_snippet_to_xml('=bench', snippet_entry)),
+        ('update_snippet_in_xml', lambda: engine.update_snippet_in_xml('=bench', '=bench2', snippet_entry)),
+        ('remove_snippet_from_xml', lambda: engine.remove_snippet_from_xml('=bench2')),
+    )
+    results = {}
+    for name, write in writes:
+        flushes = engine.snippet_writer.stats()['flushes']
+        start_time = time.perf_counter()
+        write()
+        call_time = time.perf_counter() - start_time
+        while engine.snippet_writer.stats()['flushes'] == flushes:
+            time.sleep(0.001)
+        results[name] = {'call_ms': call_time * 1000, 'file_write_ms': engine.snippet_writer.stats()['last_flush_latency_ms']}
+    engine.stop_engine()
+    return results
+
+def bench_keystrokes(xml_file, snippets_data, trace):
+    """
+    Replay a keystroke trace through the keyboard handler at full speed.
+
+    Each key goes through on_key_press and is handled as it would be on the Tk thread. The time spent waiting for
+    an expansion to finish before the next key is excluded, so the result is the cost of handling keys.
+
+    Parameters:
+    - xml_file: The path to the XML file of the library, which snippet edits would be saved to.
+    - snippets_data: The library.
+    - trace: A list of key names.
+
+    Returns:
+    - results: A dictionary with the keys handled per second, the per key latency percentiles in microseconds and the
+               number of expansions.
+    """
+    backend = TraceReplayBackend(trace)
+    engine = NotatorAssistant.headless(snippets_data, Settings(), xml_file, backend)
+    histogram = LatencyHistogram(lowest=0.000001)
+    event_start = [time.perf_counter()]
+
+    def after_event():
+        engine.handle_ui_events()
+        histogram.record(time.perf_counter() - event_start[0])
+        while engine.expansion_worker.busy.is_set():
+            time.sleep(0)
+        engine.handle_ui_events()  # The reset posted by the expansion worker
+        event_start[0] = time.perf_counter()
+
+    backend.replay(after_event)
+    engine.stop_engine()
+    summary = histogram.summary()
+    return {
+        'keys': summary['count'],
+        'keys_per_s': summary['count'] / histogram.total if histogram.total else 0.0,
+        'p50_us': summary['p50'] * 1e6,
+        'p99_us': summary['p99'] * 1e6,
+        'max_us': summary['max'] * 1e6,
+        'expansions': sum(1 for entry in backend.output if entry[0] == 'write'),
+    }
+
+def bench_templates(screenshots_dir, images_dir, repeat):
+    """
+    Time searching for every automation image in stored screenshots.
+
+    Parameters:
+    - screenshots_dir: The directory containing PNG screenshots.
+    - images_dir: The directory containing the automation images.
+    - repeat: The number of searches per image and screenshot.
+
+    Returns:
+    - results: A dictionary mapping each screenshot to the mean search time in milliseconds and whether each image was found.
+    """
+    from PIL import Image
+
+    bank = TemplateBank(images_dir)
+    bank.load()
+    matcher = TemplateMatcher(TraceReplayBackend())
+    results = {}
+    for file_name in sorted(os.listdir(screenshots_dir)):
+        if not file_name.lower().endswith('.png'):
+            continue
+        with Image.open(os.path.join(screenshots_dir, file_name)) as screen:
+            screen = screen.convert('RGB')
+        screen_results = {}
+        for name, template in bank.templates.items():
+            found = None
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                found = matcher.locate(template, screen, 0.99)
+            screen_results[name] = {'search_ms': (time.perf_counter() - start_time) / repeat * 1000, 'found': found is not None}
+        results[file_name] = screen_results
+    return results
+
+def bench_auto_close(session_dir, images_dir):
+    """
+    Replay a recorded auto close session at full speed.
+
+    Parameters:
+    - session_dir: The directory containing the PNG screenshots of the session, one taken after each click.
+    - images_dir: The directory containing the automation images.
+
+    Returns:
+    - results: A dictionary with the job summary, the number of clicks, captures and searches, and the wall and
+               replayed time in milliseconds.
+    """
+    screens = [os.path.join(session_dir, file_name) for file_name in sorted(os.listdir(session_dir)) if file_name.lower().endswith('.png')]
+    backend = TraceReplayBackend(screens=screens)
+    matcher = TemplateMatcher(backend)
+    job = AutoCloseJob(matcher, TemplateBank(images_dir), Settings().click_interval, lambda job: None, lambda job: None)
+
+    start_time = time.perf_counter()
+    job.run()  # On this thread, the backend never waits
+    wall_time = time.perf_counter() - start_time
+    return {
+        'summary': job.summary(),
+        'clicks': sum(1 for entry in backend.output if entry[0] == 'click'),
+        'captures': matcher.captures,
+        'searches': matcher.searches,
+        'wall_ms': wall_time * 1000,
+        'replayed_ms': backend.clock() * 1000,
+    }
+
+def print_table(title, rows):
+    """
+    Print results as a table.
+
+    Parameters:
+    - title: The title of the table.
+    - rows: A dictionary mapping row names to dictionaries of values.
+
+    Returns:
+    None
+    """
+    print(f"\n{title}")
+    columns = list(next(iter(rows.values())))
+    print(f"  {'':<32}" + "".join(f"{column:>16}" for column in columns))
+    for name, values in rows.items():
+        cells = "".join(f"{value:>16.2f}" if isinstance(value, float) else f"{value!s:>16}" for value in values.values())
+        print(f"  {name:<32}{cells}")
+
+def main():
+    """
+    Run the benchmarks selected on the command line and print the results.
+
+    Parameters:
+    None
+
+    Returns:
+    None
+    """
+    parser = argparse.ArgumentParser(description="Benchmark Notator Assistant without a desktop.")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="comma separated snippet library sizes")
+    parser.add_argument('--trace', help="keystroke trace file, one key name or <click> per line")
+    parser.add_argument('--trace-length', type=int, default=20000, help="length of the generated keystroke trace")
+    parser.add_argument('--screenshots', help="directory of PNG screenshots to search for the automation images")
+    parser.add_argument('--session', help="directory of PNG screenshots of an auto close run, one after each click")
+    parser.add_argument('--images', default='img', help="directory of the automation images")
+    parser.add_argument('--issues', type=int, default=3, help="issues in the auto close session generated without --screenshots or --session")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement, the fastest is kept")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the generated libraries and traces")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    app.EXPANSION_SETTLE_DELAY = 0  # Replayed keys are not echoed back by a hook, so expansions need no settle time
+
+    results = {'python': sys.version.split()[0], 'platform': sys.platform, 'seed': args.seed, 'libraries': {}}
+    results['startup_ms'] = bench_startup(args.repeat)
+    print_table("Startup (ms)", {name: {'ms': ms} for name, ms in results['startup_ms'].items()})
+
+    with tempfile.TemporaryDirectory(prefix='notator-benchmark-') as directory:
+        for size in (int(size) for size in args.sizes.split(',')):
+            rng = random.Random(args.seed)
+            snippets_data = generate_library(size, rng)
+            xml_file = os.path.join(directory, f"snippets-{size}.xml")
+
+            start_time = time.perf_counter()
+            write_snippets_to_xml(xml_file, snippets_data)
+            write_time = time.perf_counter() - start_time
+
+            trace = read_event_trace(args.trace) if args.trace else generate_trace(list(snippets_data), rng, args.trace_length)
+            library = {
+                'file_kb': os.path.getsize(xml_file) / 1024,
+                'write_snippets_to_xml_ms': write_time * 1000,
+                'read_ms': bench_read(xml_file, snippets_data, args.repeat),
+                'writes': bench_writes(xml_file, snippets_data),
+                'keystrokes': bench_keystrokes(xml_file, snippets_data, trace),
+            }
+            results['libraries'][size] = library
+
+            print(f"\n=== {size:,} snippets ({library['file_kb']:,.0f} KB, written in {library['write_snippets_to_xml_ms']:.1f} ms) ===")
+            print_table("Load (ms)", {name: {'ms': ms} for name, ms in library['read_ms'].items()})
+            print_table("Write methods", library['writes'])
+            print_table("Keystroke replay", {'on_key_press': library['keystrokes']})
+
+    with tempfile.TemporaryDirectory(prefix='notator-session-') as directory:
+        # Without recorded screenshots, search and replay generated ones, with the images generated for them
+        if not (args.screenshots and args.session):
+            generated = generate_session(directory, args.issues, random.Random(args.seed))
+            results['generated_session_issues'] = args.issues
+        screenshots, screenshot_images = (args.screenshots, args.images) if args.screenshots else (generated[1], generated[0])
+        session, session_images = (args.session, args.images) if args.session else (generated[2], generated[0])
+
+        results['templates'] = bench_templates(screenshots, screenshot_images, args.repeat)
+        for file_name, screen_results in results['templates'].items():
+            print_table(f"Template search in {file_name}", screen_results)
+
+        results['auto_close'] = bench_auto_close(session, session_images)
+        print_table("Auto close replay", {args.session or "generated session": results['auto_close']})
+
+    results['timers_ms'] = DIAGNOSTICS.report()['timers_ms']
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()